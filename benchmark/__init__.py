@@ -0,0 +1,7 @@
+import pathlib
+import sys
+
+# Benchmarks import the runtime modules as the Lambda does, e.g. `import chalicelib.config`.
+RUNTIME_DIR = pathlib.Path(__file__).parent.parent / "runtime"
+if str(RUNTIME_DIR) not in sys.path:
+    sys.path.insert(0, str(RUNTIME_DIR))
@@ -0,0 +1,55 @@
+import json
+import pathlib
+import sys
+import typing
+
+# Report is {"options": {...}, "results": {case name: {metric name: value}}}
+ReportType = dict[str, typing.Any]
+
+
+def compare(
+    results: dict[str, dict[str, typing.Any]],
+    baseline: dict[str, dict[str, typing.Any]],
+    metrics: dict[str, bool],
+    tolerance: float,
+) -> list[str]:
+    """`metrics` is metric name -> whether the higher value is better."""
+    regressions: list[str] = []
+    for case, case_metrics in results.items():
+        for metric, higher_is_better in metrics.items():
+            current, base = case_metrics.get(metric), baseline.get(case, {}).get(metric)
+            if not current or not base:
+                continue
+
+            change = (current - base) / base
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{case}.{metric}: {base} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def check(
+    report: ReportType,
+    path: pathlib.Path,
+    metrics: dict[str, bool],
+    tolerance: float,
+    update: bool = False,
+) -> int:
+    """Saves the report as the baseline, or compares the report with the baseline. Returns the exit code."""
+    if update:
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline is written on {path}", file=sys.stderr)
+        return 0
+
+    if not path.is_file():
+        print(f"Baseline {path} not found, run with --update-baseline to create it.", file=sys.stderr)
+        return 0
+
+    baseline = json.loads(path.read_text())
+    if baseline.get("options") != report["options"]:
+        print("Options are different from the baseline, so the results may not be comparable.", file=sys.stderr)
+    if regressions := compare(report["results"], baseline.get("results", {}), metrics, tolerance):
+        print("Regressions found:\n" + "\n".join(f"  {r}" for r in regressions), file=sys.stderr)
+        return 1
+
+    print("No regression found.", file=sys.stderr)
+    return 0
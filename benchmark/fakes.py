@@ -0,0 +1,169 @@
+"""
+Fake providers for the benchmarks. They respond like the real services after the configured latency,
+and fail with the configured error rate, so that the benchmarks run without network or credentials.
+"""
+
+import asyncio
+import dataclasses
+import io
+import json
+import random
+import threading
+import time
+import typing
+import uuid
+
+import botocore.exceptions
+import httpx
+
+
+@dataclasses.dataclass(frozen=True)
+class ProviderProfile:
+    latency_ms: float = 20.0
+    # Latency is uniformly distributed in latency_ms ± jitter_ms.
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0
+    # HTTP status of the failed responses. 5xx responses are retried by the clients, 4xx ones are not.
+    error_status_code: int = 400
+
+    def get_latency_second(self) -> float:
+        return max(self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms), 0.0) / 1000  # nosec: B311
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate  # nosec: B311
+
+
+class LatencyRecorder:
+    """Records when each recipient is handled by the provider, relative to the start of the current iteration."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.latencies_second: list[float] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.calls = 0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latencies_second.clear()
+            self.succeeded = self.failed = self.calls = 0
+
+    def record(self, recipient_count: int, failed_count: int = 0) -> None:
+        elapsed = time.perf_counter() - self.started_at
+        with self._lock:
+            self.calls += 1
+            self.latencies_second.extend([elapsed] * recipient_count)
+            self.failed += failed_count
+            self.succeeded += recipient_count - failed_count
+
+
+def client_error(code: str, message: str, operation_name: str) -> botocore.exceptions.ClientError:
+    return botocore.exceptions.ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+
+class FakeS3Client:
+    """Serves the objects from the memory. Only the calls used by `chalicelib.aws_resource` are implemented."""
+
+    def __init__(self, profile: ProviderProfile, objects: dict[str, bytes] | None = None) -> None:
+        self.profile = profile
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        for key, body in (objects or {}).items():
+            self.put_object(Bucket="", Key=key, Body=body)
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: str | None = None, **_: typing.Any) -> dict:
+        time.sleep(self.profile.get_latency_second())
+        if Key not in self.objects:
+            raise client_error("NoSuchKey", "The specified key does not exist.", "GetObject")
+
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise client_error("304", "Not Modified", "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **_: typing.Any) -> dict:
+        etag = f'"{uuid.uuid4().hex}"'
+        self.objects[Key] = (Body, etag)
+        return {"ETag": etag}
+
+
+class FakeSESClient:
+    def __init__(self, profile: ProviderProfile, recorder: LatencyRecorder) -> None:
+        self.profile = profile
+        self.recorder = recorder
+        self.templates: dict[str, dict[str, str]] = {}
+
+    def send_email(self, **_: typing.Any) -> dict:
+        time.sleep(self.profile.get_latency_second())
+        if self.profile.should_fail():
+            self.recorder.record(recipient_count=1, failed_count=1)
+            raise client_error("MessageRejected", "Email address is not verified.", "SendEmail")
+
+        self.recorder.record(recipient_count=1)
+        return {"MessageId": uuid.uuid4().hex}
+
+    def get_template(self, TemplateName: str) -> dict:
+        time.sleep(self.profile.get_latency_second())
+        if TemplateName not in self.templates:
+            raise client_error("TemplateDoesNotExist", f"Template {TemplateName} does not exist.", "GetTemplate")
+        return {"Template": self.templates[TemplateName]}
+
+    def create_template(self, Template: dict[str, str]) -> dict:
+        time.sleep(self.profile.get_latency_second())
+        self.templates[Template["TemplateName"]] = Template
+        return {}
+
+    def send_bulk_templated_email(self, Destinations: list[dict], **_: typing.Any) -> dict:
+        time.sleep(self.profile.get_latency_second())
+        statuses = [
+            (
+                {"Status": "MessageRejected", "Error": "Email address is not verified."}
+                if self.profile.should_fail()
+                else {"Status": "Success", "MessageId": uuid.uuid4().hex}
+            )
+            for _ in Destinations
+        ]
+        failed_count = sum(status["Status"] != "Success" for status in statuses)
+        self.recorder.record(recipient_count=len(statuses), failed_count=failed_count)
+        return {"Status": statuses}
+
+
+def get_async_transport(
+    profile: ProviderProfile,
+    recorder: LatencyRecorder,
+    respond: typing.Callable[[httpx.Request], tuple[int, dict]],
+) -> httpx.MockTransport:
+    """`respond` returns the number of the recipients and the JSON body of the successful response."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(profile.get_latency_second())
+        recipient_count, body = respond(request)
+        if profile.should_fail():
+            recorder.record(recipient_count=recipient_count, failed_count=recipient_count)
+            return httpx.Response(status_code=profile.error_status_code, json={"ok": False})
+
+        recorder.record(recipient_count=recipient_count)
+        return httpx.Response(status_code=200, json=body)
+
+    return httpx.MockTransport(handler)
+
+
+def respond_telegram_send_message(request: httpx.Request) -> tuple[int, dict]:
+    return 1, {"ok": True, "result": {"message_id": random.randint(1, 2**31)}}  # nosec: B311
+
+
+def respond_toast_send_alimtalk(request: httpx.Request) -> tuple[int, dict]:
+    recipients = json.loads(request.content)["recipientList"]
+    return len(recipients), {
+        "header": {"resultCode": 0, "resultMessage": "SUCCESS", "isSuccessful": True},
+        "message": {
+            "requestId": uuid.uuid4().hex,
+            "sendResults": [
+                {"recipientSeq": index, "recipientNo": r["recipientNo"], "resultCode": 0, "resultMessage": "SUCCESS"}
+                for index, r in enumerate(recipients, start=1)
+            ],
+        },
+    }
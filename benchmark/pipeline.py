@@ -0,0 +1,285 @@
+"""
+Benchmarks the send pipeline with the fake providers, from the SQS event to the provider calls.
+Each scenario runs on its own process, so that the caches and the peak RSS are not shared between scenarios.
+
+Usage: python -m benchmark.pipeline [--scenarios aws_ses toast_alimtalk] [--update-baseline]
+"""
+
+import argparse
+import concurrent.futures
+import dataclasses
+import json
+import multiprocessing
+import os
+import pathlib
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import typing
+import uuid
+
+import benchmark.baseline as baseline
+import benchmark.fakes as fakes
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "pipeline_baseline.json"
+# Benchmarks must not reach the real services, so every service is configured with the dummy values.
+BENCHMARK_ENV_VARS = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "INFRA__PREWARM_SESSIONS": "false",
+    "INFRA__COLDSTART_REPORT": "false",
+    "TOAST__DOMAIN": "https://api-alimtalk.benchmark.invalid",
+    "TOAST__API_VER": "v2.3",
+    "TOAST__APP_KEY": "benchmark",
+    "TOAST__SECRET_KEY": "benchmark",
+    "TOAST__SENDER_KEY": "benchmark",
+    "TELEGRAM__BOT_TOKEN": "benchmark",
+}
+
+TEMPLATE_CODE = "benchmark"
+S3_OBJECTS = {
+    f"email/template/{TEMPLATE_CODE}.json": json.dumps(
+        {
+            "from_": "noreply@example.com",
+            "title": "[{{ service }}] Hello, {{ name }}",
+            "body": "<p>Hello, {{ name }}!</p><p>Your order {{ order_id }} has been shipped.</p>",
+        }
+    ).encode(),
+    f"telegram/template/{TEMPLATE_CODE}.json": json.dumps(
+        {"body": "Hello, {{ name }}! Your order {{ order_id }} has been shipped.", "entities": [], "buttons": []}
+    ).encode(),
+}
+
+# scenario name -> (service name, whether the scenario is driven through the SQS handler)
+SCENARIOS: dict[str, tuple[str, bool]] = {
+    "aws_ses": ("aws_ses", True),
+    "aws_ses_bulk": ("aws_ses", True),
+    "toast_alimtalk": ("toast_alimtalk", True),
+    # Telegram sender is not registered on the send managers yet, so it's driven directly.
+    "telegram_botmessaging": ("telegram_botmessaging", False),
+}
+
+# metric name -> whether the higher value is better
+COMPARED_METRICS: dict[str, bool] = {
+    "messages_per_second": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mib": False,
+    "alloc_peak_bytes_per_message": False,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkOptions:
+    iterations: int = 5
+    messages_per_event: int = 10
+    recipients_per_message: int = 100
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0
+    error_status_code: int = 400
+    s3_latency_ms: float = 10.0
+    # Seed of the fake latencies and errors, so that the runs are comparable.
+    seed: int = 0
+
+    @property
+    def profile(self) -> fakes.ProviderProfile:
+        return fakes.ProviderProfile(
+            latency_ms=self.latency_ms,
+            jitter_ms=self.jitter_ms,
+            error_rate=self.error_rate,
+            error_status_code=self.error_status_code,
+        )
+
+
+class FakeLambdaContext:
+    def get_remaining_time_in_millis(self) -> int:
+        return 15 * 60 * 1000
+
+
+def get_recipient(service_name: str, index: int) -> str:
+    if service_name == "toast_alimtalk":
+        return f"010{index:08d}"
+    if service_name == "telegram_botmessaging":
+        return str(100_000_000 + index)
+    return f"user{index}@example.com"
+
+
+def build_send_request(service_name: str, options: BenchmarkOptions, offset: int) -> dict[str, typing.Any]:
+    return {
+        "template_code": TEMPLATE_CODE,
+        "shared_context": {"service": "NotiCo"},
+        "personalized_context": {
+            get_recipient(service_name, index): {"name": f"User {index}", "order_id": f"ORDER-{index:08d}"}
+            for index in range(offset, offset + options.recipients_per_message)
+        },
+    }
+
+
+def build_sqs_event(service_name: str, options: BenchmarkOptions) -> dict[str, typing.Any]:
+    records = []
+    for message_index in range(options.messages_per_event):
+        body = {
+            "worker": "notification_sender",
+            "worker_payload": {
+                "sender_type": service_name,
+                "sender_payload": build_send_request(
+                    service_name, options, offset=message_index * options.recipients_per_message
+                ),
+            },
+        }
+        records.append(
+            {
+                "messageId": str(uuid.uuid4()),
+                "receiptHandle": uuid.uuid4().hex,
+                "body": json.dumps(body),
+                "attributes": {
+                    "MessageGroupId": f"benchmark-{message_index}",
+                    "SentTimestamp": str(int(time.time() * 1000)),
+                },
+                "messageAttributes": {},
+                "md5OfBody": "",
+                "eventSource": "aws:sqs",
+                "eventSourceARN": "arn:aws:sqs:us-east-1:000000000000:notico.fifo",
+                "awsRegion": "us-east-1",
+            }
+        )
+    return {"Records": records}
+
+
+def get_percentile(sorted_values: list[float], ratio: float) -> float | None:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(int(len(sorted_values) * ratio), len(sorted_values) - 1)], 2)
+
+
+def run_scenario(scenario: str, options: BenchmarkOptions) -> dict[str, typing.Any]:
+    # Imported here, as the runtime modules read the environment variables on import.
+    import chalicelib.aws_resource as aws_resource
+    import chalicelib.config as config_module
+    import chalicelib.send_manager as send_manager
+    import chalicelib.send_manager.__interface__ as sendmgr_interface
+    import chalicelib.send_manager.telegram_botmessaging as telegram_send_manager
+    import chalicelib.util.concurrency_util as concurrency_util
+    import chalicelib.worker as worker
+    import httpx
+
+    random.seed(options.seed)
+    service_name, via_sqs = SCENARIOS[scenario]
+    config = config_module.config
+    recorder = fakes.LatencyRecorder()
+
+    # Rate limits would measure the limiter instead of the pipeline.
+    for service_config in (config.ses, config.toast, config.telegram):
+        service_config.rate_limit_per_second = service_config.rate_limit_per_receiver_per_second = None
+    config.ses.bulk_mode = scenario == "aws_ses_bulk"
+
+    s3_profile = fakes.ProviderProfile(latency_ms=options.s3_latency_ms, jitter_ms=0)
+    aws_resource.set_client("s3", fakes.FakeS3Client(profile=s3_profile, objects=S3_OBJECTS))
+    aws_resource.set_client("ses", fakes.FakeSESClient(profile=options.profile, recorder=recorder))
+
+    mgr: sendmgr_interface.SendManagerInterface
+    if service_name == "telegram_botmessaging":
+        mgr = telegram_send_manager.TelegramBotMessagingSender()
+        transport = fakes.get_async_transport(options.profile, recorder, fakes.respond_telegram_send_message)
+        session_key, base_url = "telegram", config.telegram.get_base_url()
+    else:
+        mgr = send_manager.send_managers[service_name]
+        transport = fakes.get_async_transport(options.profile, recorder, fakes.respond_toast_send_alimtalk)
+        session_key, base_url = "toast:alimtalk", config.toast.get_base_url("alimtalk")
+    # Sends run on the shared event loop, so the fake session is registered for that loop.
+    config_module.set_shared_async_session(
+        key=session_key,
+        session=httpx.AsyncClient(base_url=base_url, transport=transport),
+        loop=concurrency_util.get_event_loop(),
+    )
+
+    event = build_sqs_event(service_name, options)
+    requests = [
+        mgr.send_request_cls.model_validate(
+            build_send_request(service_name, options, offset=index * options.recipients_per_message)
+        )
+        for index in range(options.messages_per_event)
+    ]
+
+    def run_once() -> None:
+        recorder.start()
+        if via_sqs:
+            worker.sqs_handler(event, FakeLambdaContext())
+        else:
+            for request in requests:
+                mgr.send(request)
+
+    run_once()  # Warm up the caches and the connections, like the warm Lambda containers.
+    recorder.reset()
+
+    elapsed_seconds = []
+    for _ in range(options.iterations):
+        started_at = time.perf_counter()
+        run_once()
+        elapsed_seconds.append(time.perf_counter() - started_at)
+
+    latencies_ms = sorted(latency * 1000 for latency in recorder.latencies_second)
+    handled, failed, calls = recorder.succeeded + recorder.failed, recorder.failed, recorder.calls
+
+    # Allocations are measured on a separate run, as tracing slows down the pipeline.
+    tracemalloc.start()
+    run_once()
+    _, alloc_peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    messages_per_iteration = options.messages_per_event * options.recipients_per_message
+    return {
+        "messages_per_second": round(messages_per_iteration * options.iterations / sum(elapsed_seconds), 2),
+        "p50_ms": get_percentile(latencies_ms, 0.5),
+        "p99_ms": get_percentile(latencies_ms, 0.99),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        "alloc_peak_bytes_per_message": round(alloc_peak_bytes / messages_per_iteration, 2),
+        "provider_calls_per_iteration": round(calls / options.iterations, 2),
+        "failed_ratio": round(failed / handled, 4) if handled else None,
+    }
+
+
+def run_scenario_on_process(scenario: str, options: BenchmarkOptions) -> dict[str, typing.Any]:
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(run_scenario, scenario, options).result()
+
+
+def main() -> int:
+    default_options = BenchmarkOptions()
+    parser = argparse.ArgumentParser(description="Benchmarks the send pipeline with the fake providers.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    for field in dataclasses.fields(BenchmarkOptions):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(getattr(default_options, field.name)))
+    parser.add_argument("--output", type=pathlib.Path, help="Writes the results as JSON on the path.")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Saves the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed ratio of the regression.")
+    args = parser.parse_args()
+
+    options = dataclasses.replace(
+        default_options,
+        **{f.name: value for f in dataclasses.fields(BenchmarkOptions) if (value := getattr(args, f.name)) is not None},
+    )
+    for key, value in BENCHMARK_ENV_VARS.items():
+        os.environ.setdefault(key, value)
+
+    results: dict[str, dict[str, typing.Any]] = {}
+    for scenario in args.scenarios:
+        results[scenario] = run_scenario_on_process(scenario, options)
+        print(f"{scenario:<24} {json.dumps(results[scenario])}", file=sys.stderr)
+
+    report = {"options": dataclasses.asdict(options), "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    return baseline.check(
+        report, path=args.baseline, metrics=COMPARED_METRICS, tolerance=args.tolerance, update=args.update_baseline
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
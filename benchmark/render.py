@@ -0,0 +1,175 @@
+"""
+Micro-benchmarks of the template rendering hot spots, for the combinations of the template size, the number of
+variables, the not-defined-variable handling mode and the variable delimiters.
+
+Usage: python -m benchmark.render [--filter render/large] [--output result.json] [--update-baseline]
+"""
+
+import argparse
+import dataclasses
+import functools
+import itertools
+import json
+import pathlib
+import sys
+import timeit
+import typing
+
+import benchmark.baseline as baseline
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "render_baseline.json"
+COMPARED_METRICS: dict[str, bool] = {"ops_per_second": True}
+
+DELIMITERS: dict[str, tuple[str, str]] = {"curly": ("{{", "}}"), "toast": ("#{", "}")}
+VARIABLE_COUNTS: dict[str, int] = {"few": 3, "many": 100}
+TEMPLATE_SIZES = ("small", "large", "nested")
+HANDLING_MODES = ("random", "show_as_template_var", "remove")
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkOptions:
+    # Each case is run for at least this long, and the best of the repeats is reported.
+    min_time_second: float = 0.2
+    repeat: int = 3
+
+
+def build_template(size: str, variable_count: int, delimiters: tuple[str, str]) -> dict[str, typing.Any]:
+    start, end = delimiters
+    variables = [f"{start} var{index} {end}" for index in range(variable_count)]
+    if size == "small":
+        return {"title": f"Hello, {variables[0]}", "body": " and ".join(variables)}
+    if size == "large":
+        # About 16KB of text, with the variables spread over it.
+        paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4
+        paragraphs = [f"<p>{paragraph}{variables[index % variable_count]}</p>" for index in range(64)]
+        return {"title": f"Hello, {variables[0]}", "body": "".join(paragraphs + variables)}
+
+    # Nested lists and dicts of 4 levels, of which leaves have the variables.
+    def _build(depth: int, offset: int) -> typing.Any:
+        if depth == 0:
+            return f"value {variables[offset % variable_count]}"
+        return {f"key{index}": [_build(depth - 1, offset * 3 + index)] for index in range(3)}
+
+    return {"title": f"Hello, {variables[0]}", "body": _build(depth=4, offset=0)} | {
+        f"extra{index}": variable for index, variable in enumerate(variables)
+    }
+
+
+def build_context(variable_count: int) -> dict[str, typing.Any]:
+    # Half of the variables are not given, so that they're handled by the not-defined-variable handling mode.
+    return {f"var{index}": f"value-{index}" for index in range(0, variable_count, 2)}
+
+
+def get_cases() -> dict[str, typing.Callable[[], typing.Any]]:
+    # Imported here, as the runtime modules are on the path only after importing `benchmark`.
+    import chalicelib.external_api.telegram_botmessaging as telegram_client
+    import chalicelib.template_manager.__interface__ as template_mgr_interface
+    import chalicelib.template_manager.telegram_botmessaging as telegram_template_mgr
+    import chalicelib.util.jinja_util as jinja_util
+    import pydantic
+
+    class InMemoryTemplateManager(template_mgr_interface.TemplateManagerInterface):
+        service_name = "benchmark"
+        permission = template_mgr_interface.TemplateManagerPermission()
+        template_structure_cls = pydantic.BaseModel
+
+        def __init__(self, name: str, delimiters: tuple[str, str]) -> None:
+            self.service_name = f"benchmark:{name}"  # type: ignore[misc]
+            self.template_variable_start_end_string = delimiters  # type: ignore[misc]
+            self.templates: dict[str, template_mgr_interface.TemplateInformation] = {}
+
+        def retrieve(self, template_code: str) -> template_mgr_interface.TemplateInformation | None:
+            return self.templates.get(template_code)
+
+    def _render_case(
+        manager: InMemoryTemplateManager, template_code: str, context: dict[str, typing.Any], mode: str
+    ) -> typing.Callable[[], typing.Any]:
+        handling_mode = typing.cast(template_mgr_interface.NotDefinedVariableHandlingType, mode)
+        # Context is copied, as the not-defined variables are filled on the given context.
+        return lambda: manager.render(
+            template_code=template_code, context=dict(context), not_defined_variable_handling=handling_mode
+        )
+
+    def _template_variables_case(
+        template_info: template_mgr_interface.TemplateInformation,
+    ) -> typing.Callable[[], typing.Any]:
+        return lambda: template_info.template_variables
+
+    cases: dict[str, typing.Callable[[], typing.Any]] = {}
+    for delimiter_name, delimiters in DELIMITERS.items():
+        manager = InMemoryTemplateManager(name=delimiter_name, delimiters=delimiters)
+        for size, (count_name, variable_count) in itertools.product(TEMPLATE_SIZES, VARIABLE_COUNTS.items()):
+            case = f"{size}/{count_name}/{delimiter_name}"
+            template = build_template(size=size, variable_count=variable_count, delimiters=delimiters)
+            template_info = manager.templates[case] = template_mgr_interface.TemplateInformation(
+                template_code=case,
+                template=template,
+                template_variable_start_end_string=delimiters,
+                version=case,
+            )
+            template_str = json.dumps(template, ensure_ascii=False)
+            context = build_context(variable_count=variable_count)
+
+            for mode in HANDLING_MODES:
+                cases[f"render/{case}/{mode}"] = _render_case(manager, case, context, mode)
+            cases[f"get_template_variables/{case}"] = functools.partial(
+                jinja_util.get_template_variables, template_str, delimiters
+            )
+            cases[f"template_variables/{case}"] = _template_variables_case(template_info)
+
+    for count_name, count in VARIABLE_COUNTS.items():
+        telegram_template = telegram_template_mgr.SimplifiedTelegramTemplate(
+            body="Hello, world! " * count,
+            entities=[
+                telegram_client.TelegramMessageEntity(type="bold", offset=index * 14, length=5)
+                for index in range(count)
+            ],
+            buttons=[
+                [telegram_template_mgr.SimplifiedTelegramTemplate.Button(text=f"Button {i}", url="https://example.com")]
+                for i in range(count)
+            ],
+        )
+        cases[f"telegram_payload/{count_name}"] = functools.partial(
+            telegram_template.to_send_message_request_payload, chat_id=100_000_000
+        )
+    return cases
+
+
+def measure(func: typing.Callable[[], typing.Any], options: BenchmarkOptions) -> dict[str, float]:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(int(number * options.min_time_second / 0.2), 1)
+    best_second = min(timer.repeat(repeat=options.repeat, number=number)) / number
+    return {"ops_per_second": round(1 / best_second, 2), "us_per_op": round(best_second * 1_000_000, 3)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the template rendering.")
+    parser.add_argument("--filter", nargs="+", help="Runs only the cases of which name contains any of them.")
+    parser.add_argument("--min-time-second", type=float, default=BenchmarkOptions.min_time_second)
+    parser.add_argument("--repeat", type=int, default=BenchmarkOptions.repeat)
+    parser.add_argument("--output", type=pathlib.Path, help="Writes the results as JSON on the path.")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Saves the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed ratio of the throughput regression.")
+    args = parser.parse_args()
+    options = BenchmarkOptions(min_time_second=args.min_time_second, repeat=args.repeat)
+
+    results: dict[str, dict[str, float]] = {}
+    for name, func in get_cases().items():
+        if args.filter and not any(f in name for f in args.filter):
+            continue
+        func()  # Warm up the compiled template cache.
+        results[name] = measure(func, options)
+        print(f"{name:<64} {json.dumps(results[name])}", file=sys.stderr)
+
+    report = {"options": dataclasses.asdict(options), "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    return baseline.check(
+        report, path=args.baseline, metrics=COMPARED_METRICS, tolerance=args.tolerance, update=args.update_baseline
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
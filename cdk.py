@@ -71,6 +71,11 @@ class DockerizedChalice(chalice.cdk.Chalice):
                     }
                 )
 
+                # Chalice doesn't support partial batch responses, so enable them on SQS event sources here.
+                for event in function["Properties"].get("Events", {}).values():
+                    if event["Type"] == "SQS":
+                        event["Properties"]["FunctionResponseTypes"] = ["ReportBatchItemFailures"]
+
                 if function_logical_id != "APIHandler":
                     # make sure the function has an output
                     sam_template["Outputs"].update(
@@ -187,13 +192,21 @@ class NotiCoApp(aws_cdk.Stack):
         )
         app_default_role = app.get_role("DefaultRole")
         queue.grant_consume_messages(grantee=app_default_role)
+        # Async mode of the send API enqueues the requests by itself.
+        queue.grant_send_messages(grantee=app_default_role)
         s3_bucket.grant_read(identity=app_default_role)
         s3_bucket.grant_write(identity=app_default_role)
         s3_bucket.grant_put(identity=app_default_role)
         s3_bucket.grant_delete(identity=app_default_role)
         app_default_role.add_to_principal_policy(
             statement=aws_cdk.aws_iam.PolicyStatement(
-                actions=["ses:SendEmail", "SES:SendRawEmail"],
+                actions=[
+                    "ses:SendEmail",
+                    "SES:SendRawEmail",
+                    "ses:SendBulkTemplatedEmail",
+                    "ses:GetTemplate",
+                    "ses:CreateTemplate",
+                ],
                 resources=["*"],
                 effect=aws_cdk.aws_iam.Effect.ALLOW,
             ),
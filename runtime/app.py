@@ -1,20 +1,85 @@
+import chalicelib.util.coldstart_util as coldstart_util  # isort: skip # Must be the first, to time the other imports.
 import logging
+import typing
 
 import chalice.app
 import chalicelib.config as config_module
 import chalicelib.logger.slack as slack_logger
 import chalicelib.route
+import chalicelib.util.metric_util as metric_util
 import chalicelib.worker
 
 config = config_module.config
 app = chalice.app.Chalice(app_name="notico")
 app.log.setLevel(logging.INFO)
 
-if config.slack.is_configured():
-    slack_logger.SlackLogger(channel=config.slack.channel, token=config.slack.token.get_secret_value(), logger=app.log)
+slack: slack_logger.SlackLogger | None = None
+with coldstart_util.profiler.measure("logger"):
+    if config.slack.is_configured():
+        slack = slack_logger.SlackLogger(
+            channel=config.slack.channel,
+            token=config.slack.token.get_secret_value(),
+            logger=app.log,
+            handler_kwargs={
+                "queue_size": config.slack.log_queue_size,
+                "batch_size": config.slack.log_batch_size,
+                "batch_interval_second": config.slack.log_batch_interval_second,
+                "dedup_window_second": config.slack.log_dedup_window_second,
+                "dedup_max_size": config.slack.log_dedup_max_size,
+                "flush_timeout_second": config.slack.log_flush_timeout_second,
+            },
+        )
+    else:
+        app.log.setLevel(logging.DEBUG)
+        app.log.warning("Slack logger is not configured")
+
+with coldstart_util.profiler.measure("register_blueprints"):
+    chalicelib.route.register_blueprints(app)
+with coldstart_util.profiler.measure("register_worker"):
+    chalicelib.worker.register_worker(app)
+
+if config.infra.prewarm_sessions:
+    with coldstart_util.profiler.measure("prewarm_sessions"):
+        config.prewarm_sessions()
+
+coldstart_util.profiler.mark_initialized()
+
+if config.infra.coldstart_report:
+
+    @app.middleware("all")
+    def coldstart_report_middleware(
+        event: typing.Any, get_response: typing.Callable[[typing.Any], typing.Any]
+    ) -> typing.Any:
+        try:
+            return get_response(event)
+        finally:
+            # The first invocation is included, as the plugins are imported lazily on it.
+            coldstart_util.profiler.emit_once(log=app.log, top_n=config.infra.coldstart_report_top_n)
+
 else:
-    app.log.setLevel(logging.DEBUG)
-    app.log.warning("Slack logger is not configured")
+    coldstart_util.profiler.uninstall()
+
+if config.infra.metrics_enabled:
+
+    @app.middleware("all")
+    def metrics_flush_middleware(
+        event: typing.Any, get_response: typing.Callable[[typing.Any], typing.Any]
+    ) -> typing.Any:
+        try:
+            return get_response(event)
+        finally:
+            # Metrics are aggregated during the invocation, and written once as EMF logs on stdout.
+            metric_util.metrics.flush()
+
+
+if slack:
 
-chalicelib.route.register_blueprints(app)
-chalicelib.worker.register_worker(app)
+    @app.middleware("all")
+    def slack_log_flush_middleware(
+        event: typing.Any, get_response: typing.Callable[[typing.Any], typing.Any]
+    ) -> typing.Any:
+        try:
+            return get_response(event)
+        finally:
+            # Lambda freezes the container after the response, so the buffered logs must be sent before it.
+            slack.flush(timeout_second=config.slack.log_flush_timeout_second)
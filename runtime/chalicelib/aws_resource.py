@@ -1,20 +1,136 @@
+import base64
+import contextlib
 import dataclasses
 import enum
+import functools
+import hashlib
+import json
+import pathlib
+import threading
+import time
 import typing
 
-import boto3
+import botocore.exceptions
 import chalicelib.config as config_module
+import chalicelib.util.cache_util as cache_util
+import chalicelib.util.metric_util as metric_util
 
 if typing.TYPE_CHECKING:
+    import boto3.session
+    import botocore.config
     import mypy_boto3_s3.client
     import mypy_boto3_ses.client
     import mypy_boto3_sqs.client
 
+    ses_client: mypy_boto3_ses.client.SESClient
+    sqs_client: mypy_boto3_sqs.client.SQSClient
+    s3_client: mypy_boto3_s3.client.S3Client
+
+AWSServiceName = typing.Literal["ses", "sqs", "s3"]
 
-ses_client: "mypy_boto3_ses.client.SESClient" = boto3.client(service_name="ses")
-sqs_client: "mypy_boto3_sqs.client.SQSClient" = boto3.client(service_name="sqs")
-s3_client: "mypy_boto3_s3.client.S3Client" = boto3.client(service_name="s3")
 s3_bucket_name: str = config_module.config.infra.s3_bucket_name
+client_lock = threading.Lock()
+# (service name, region name) -> client. Clients are created when they're used first, as it's slow to create them.
+clients: dict[tuple[AWSServiceName, str | None], typing.Any] = {}
+
+
+def get_client_config() -> "botocore.config.Config":
+    import botocore.config
+
+    infra_config = config_module.config.infra
+    return botocore.config.Config(
+        max_pool_connections=infra_config.aws_max_pool_connections,
+        connect_timeout=infra_config.aws_connect_timeout_second,
+        read_timeout=infra_config.aws_read_timeout_second,
+        retries={"mode": infra_config.aws_retry_mode, "max_attempts": infra_config.aws_max_attempts},
+        tcp_keepalive=True,
+    )
+
+
+@functools.cache
+def get_session() -> "boto3.session.Session":
+    # boto3 takes long to be imported, so it's imported when the first client is created.
+    import boto3.session
+
+    return boto3.session.Session()
+
+
+def get_client(service_name: AWSServiceName, region_name: str | None = None) -> typing.Any:
+    if not (client := clients.get(key := (service_name, region_name))):
+        # Creating clients from the same session is not thread-safe, so they're created one by one.
+        with client_lock:
+            if not (client := clients.get(key)):
+                client = clients[key] = get_session().client(
+                    service_name=service_name, region_name=region_name, config=get_client_config()
+                )
+    return client
+
+
+def set_client(service_name: AWSServiceName, client: typing.Any, region_name: str | None = None) -> None:
+    """Overrides the client, e.g. to inject the stubbed client."""
+    with client_lock:
+        clients[(service_name, region_name)] = client
+
+
+def __getattr__(name: str) -> typing.Any:
+    # Keeps `aws_resource.s3_client` and so on working, while the client is created on the first access.
+    if (service_name := name.removesuffix("_client")) in typing.get_args(AWSServiceName):
+        return get_client(typing.cast(AWSServiceName, service_name))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@dataclasses.dataclass(frozen=True)
+class S3CachedObject:
+    body: bytes
+    etag: str
+    validated_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.validated_at < config_module.config.cache.s3_freshness_second
+
+
+class S3ObjectCache:
+    def __init__(self, max_size: int, tmp_dir: str | None = None) -> None:
+        self.memory: cache_util.LRUTTLCache[str, S3CachedObject] = cache_util.LRUTTLCache(max_size=max_size)
+        self.tmp_dir = pathlib.Path(tmp_dir) if tmp_dir else None
+
+    def _get_tmp_path(self, key: str) -> pathlib.Path | None:
+        return self.tmp_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json" if self.tmp_dir else None
+
+    def get(self, key: str) -> S3CachedObject | None:
+        if (cached := self.memory.get(key)) or not (tmp_path := self._get_tmp_path(key)):
+            return cached
+
+        with contextlib.suppress(OSError, ValueError, KeyError):
+            data = json.loads(tmp_path.read_text())
+            cached = S3CachedObject(
+                body=base64.b64decode(data["body"]),
+                etag=data["etag"],
+                validated_at=data["validated_at"],
+            )
+            self.memory.set(key, cached)
+        return cached
+
+    def set(self, key: str, value: S3CachedObject) -> None:
+        self.memory.set(key, value)
+        if tmp_path := self._get_tmp_path(key):
+            with contextlib.suppress(OSError):
+                tmp_path.parent.mkdir(parents=True, exist_ok=True)
+                data = {"body": base64.b64encode(value.body).decode(), "etag": value.etag}
+                tmp_path.write_text(json.dumps(data | {"validated_at": value.validated_at}))
+
+    def invalidate(self, key: str) -> None:
+        self.memory.pop(key)
+        if tmp_path := self._get_tmp_path(key):
+            tmp_path.unlink(missing_ok=True)
+
+
+s3_object_cache = S3ObjectCache(
+    max_size=config_module.config.cache.s3_max_size,
+    tmp_dir=config_module.config.cache.s3_tmp_dir,
+)
+metric_util.metrics.track_cache("s3_object", s3_object_cache.memory.stats)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -25,27 +141,94 @@ class S3ResourceInfo:
     def as_path(self, template_code: str) -> str:
         return self.prefix + f"{template_code}.{self.extension}"
 
+    @property
+    def index_path(self) -> str:
+        # Index is stored outside of the prefix, so that it's not listed as a template.
+        return self.prefix.rstrip("/") + f".index.{self.extension}"
+
 
 class S3ResourcePath(enum.Enum):
     email_template = S3ResourceInfo(prefix="email/template/", extension="json")
     telegram_template = S3ResourceInfo(prefix="telegram/template/", extension="json")
     firebase_template = S3ResourceInfo(prefix="firebase/template/", extension="json")
 
+    def fetch(self, template_code: str) -> S3CachedObject:
+        return self._fetch_key(key=self.value.as_path(template_code))
+
+    def _fetch_key(self, key: str) -> S3CachedObject:
+        if (cached := s3_object_cache.get(key)) and cached.is_fresh:
+            return cached
+
+        try:
+            # Revalidate the cached object with a conditional GET, S3 responds 304 if the object is not modified.
+            conditions = {"IfNoneMatch": cached.etag} if cached else {}
+            response = get_client("s3").get_object(Bucket=s3_bucket_name, Key=key, **conditions)
+            cached = S3CachedObject(body=response["Body"].read(), etag=response["ETag"], validated_at=time.time())
+        except botocore.exceptions.ClientError as e:
+            if not (cached and e.response.get("Error", {}).get("Code") == "304"):
+                s3_object_cache.invalidate(key)
+                raise
+            cached = dataclasses.replace(cached, validated_at=time.time())
+
+        s3_object_cache.set(key, cached)
+        return cached
+
     def download(self, template_code: str) -> bytes:
-        return s3_client.get_object(Bucket=s3_bucket_name, Key=self.value.as_path(template_code))["Body"].read()
+        return self.fetch(template_code=template_code).body
 
-    def upload(self, template_code: str, content: str) -> None:
-        s3_client.put_object(Bucket=s3_bucket_name, Key=self.value.as_path(template_code), Body=content.encode())
+    def upload(self, template_code: str, content: str) -> str:
+        key = self.value.as_path(template_code)
+        response = get_client("s3").put_object(Bucket=s3_bucket_name, Key=key, Body=content.encode())
+        s3_object_cache.invalidate(key)
+        return response["ETag"]
 
     def delete(self, template_code: str) -> None:
-        s3_client.delete_object(Bucket=s3_bucket_name, Key=self.value.as_path(template_code))
+        get_client("s3").delete_object(Bucket=s3_bucket_name, Key=self.value.as_path(template_code))
+        s3_object_cache.invalidate(self.value.as_path(template_code))
 
     def list_objects(self, filter_by_extension: bool = False) -> list[str]:
-        if objs := s3_client.list_objects(Bucket=s3_bucket_name, Prefix=self.value.prefix).get("Contents", None):
-            return [
-                key
-                for obj in objs
-                if (key := obj["Key"].replace(self.value.prefix, ""))
-                and (not filter_by_extension or key.split(".")[-1] == self.value.extension)
-            ]
-        return []
+        paginator = get_client("s3").get_paginator("list_objects_v2")
+        return [
+            key
+            for page in paginator.paginate(Bucket=s3_bucket_name, Prefix=self.value.prefix)
+            for obj in page.get("Contents", [])
+            if (key := obj["Key"].removeprefix(self.value.prefix))
+            and (not filter_by_extension or key.split(".")[-1] == self.value.extension)
+        ]
+
+    def fetch_index(self) -> dict[str, typing.Any] | None:
+        try:
+            return json.loads(self._fetch_key(key=self.value.index_path).body)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def update_index(self, entries: dict[str, typing.Any | None], replace: bool = False, max_attempts: int = 5) -> None:
+        """
+        Sets the entries of the index, and removes the entries of which value is `None`.
+        The index is updated with the conditional write, so the concurrent updates don't overwrite each other.
+        """
+        key = self.value.index_path
+        for _ in range(max_attempts):
+            s3_object_cache.invalidate(key)
+            try:
+                response = get_client("s3").get_object(Bucket=s3_bucket_name, Key=key)
+                index, conditions = json.loads(response["Body"].read()), {"IfMatch": response["ETag"]}
+            except botocore.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                    raise
+                index, conditions = {}, {"IfNoneMatch": "*"}
+
+            index = {} if replace else index
+            index.update(entries)
+            index = {k: v for k, v in index.items() if v is not None}
+            try:
+                body = json.dumps(index).encode()
+                get_client("s3").put_object(Bucket=s3_bucket_name, Key=key, Body=body, **conditions)
+                return
+            except botocore.exceptions.ClientError as e:
+                # Someone else updated the index after we read it, so read it again and retry.
+                if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise
+        raise RuntimeError(f"Failed to update the index {key} after {max_attempts} attempts")
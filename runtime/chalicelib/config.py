@@ -1,25 +1,133 @@
+import asyncio
 import contextlib
+import datetime
+import functools
+import importlib.util
+import json
 import logging
+import random
+import threading
+import time
 import typing
 import urllib.parse
+import weakref
 
-import firebase_admin
-import firebase_admin.credentials
 import httpx
 import pydantic
 import pydantic_settings
 
+if typing.TYPE_CHECKING:
+    # firebase_admin is heavy to import, so it's imported only when the Firebase app is used first.
+    import firebase_admin
+    import firebase_admin.credentials
+
 AllowedToastServices = typing.Literal["alimtalk"]
+RateLimitBackendType = typing.Literal["local", "file", "redis"]
+MetricSinkType = typing.Literal["stdout", "memory"]
+SendAPIModeType = typing.Literal["sync", "async"]
+EnqueueMessageGroupByType = typing.Literal["message", "request", "service"]
+PREWARM_TIMEOUT_SECOND = 2.0
 logger = logging.getLogger(__name__)
+firebase_lock = threading.Lock()
+gmail_lock = threading.Lock()
+session_lock = threading.Lock()
+# Sessions are shared by the whole process, so that the connections in the pool are reused across the clients.
+sessions: dict[str, httpx.Client] = {}
+# Async sessions are bound to the event loop where they're used first, so they're shared per event loop.
+async_sessions: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_shared_session(key: str, factory: typing.Callable[[], httpx.Client]) -> httpx.Client:
+    if not (session := sessions.get(key)):
+        with session_lock:
+            if not (session := sessions.get(key)):
+                session = sessions[key] = factory()
+    return session
+
+
+def set_shared_session(key: str, session: httpx.Client | None) -> None:
+    """Overrides the shared session, e.g. to inject a session with a mock transport. `None` removes the session."""
+    with session_lock:
+        if (previous := sessions.pop(key, None)) and previous is not session:
+            previous.close()
+        if session:
+            sessions[key] = session
+
+
+def get_shared_async_session(key: str, factory: typing.Callable[[], httpx.AsyncClient]) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    if not (session := async_sessions.get(loop, {}).get(key)):
+        with session_lock:
+            loop_sessions = async_sessions.setdefault(loop, {})
+            if not (session := loop_sessions.get(key)):
+                session = loop_sessions[key] = factory()
+    return session
+
+
+def set_shared_async_session(key: str, session: httpx.AsyncClient | None, loop: asyncio.AbstractEventLoop) -> None:
+    """Same as `set_shared_session`, but overrides the async session used on `loop`."""
+    with session_lock:
+        loop_sessions = async_sessions.setdefault(loop, {})
+        if (previous := loop_sessions.pop(key, None)) and previous is not session and loop.is_running():
+            asyncio.run_coroutine_threadsafe(previous.aclose(), loop)
+        if session:
+            loop_sessions[key] = session
+
+
+def log_request(req: httpx.Request, sample_rate: float = 1.0) -> None:
+    # Only the timestamp is recorded here, bodies are never read to keep the streaming responses untouched.
+    req.extensions["notico_started_at"] = time.perf_counter()
+    req.extensions["notico_sampled"] = sample_rate > 0 and random.random() < sample_rate  # nosec: B311
+    if req.extensions["notico_sampled"]:
+        logger.info(f"REQ [{req.method}]{req.url}")
+
+
+def log_response(resp: httpx.Response, sample_rate: float = 1.0) -> None:
+    req = resp.request
+    # Failed responses are always logged, but without their bodies.
+    if req.extensions.get("notico_sampled") or resp.is_error:
+        elapsed_ms = (time.perf_counter() - req.extensions.get("notico_started_at", time.perf_counter())) * 1000
+        logger.info(f"RES [{req.method}]{req.url}<{resp.status_code}> {elapsed_ms:.1f}ms")
 
 
-def log_request(req: httpx.Request) -> None:
-    logger.info(f"REQ [{req.method}]{req.url}")
+async def log_request_async(req: httpx.Request, sample_rate: float = 1.0) -> None:
+    log_request(req, sample_rate)
 
 
-def log_response(resp: httpx.Response) -> None:
-    req = resp.request
-    logger.info(f"RES [{req.method}]{req.url}<{resp.status_code}> {resp.read().decode(errors='ignore')=}")
+async def log_response_async(resp: httpx.Response, sample_rate: float = 1.0) -> None:
+    log_response(resp, sample_rate)
+
+
+def open_connection(session: httpx.Client) -> None:
+    # Response doesn't matter, the request only opens the keep-alive connection (TCP/TLS handshake) to the host.
+    with contextlib.suppress(httpx.HTTPError):
+        session.head("", timeout=PREWARM_TIMEOUT_SECOND)
+
+
+def open_connections(
+    get_session: typing.Callable[[], httpx.Client], get_async_session: typing.Callable[[], httpx.AsyncClient]
+) -> None:
+    # Imported here, as the CDK app imports this module without the runtime modules on the path.
+    import chalicelib.util.concurrency_util as concurrency_util
+
+    async def _open_async_connection() -> None:
+        with contextlib.suppress(httpx.HTTPError):
+            await get_async_session().head("", timeout=PREWARM_TIMEOUT_SECOND)
+
+    # Messages are sent by the async session on the shared event loop, and the sync one is used for the templates.
+    # Both are opened at the same time, so that the prewarm doesn't take longer than a single handshake.
+    future = asyncio.run_coroutine_threadsafe(_open_async_connection(), concurrency_util.get_event_loop())
+    open_connection(get_session())
+    future.result()
+
+
+@functools.cache
+def is_http2_available() -> bool:
+    if not (available := importlib.util.find_spec("h2") is not None):
+        logger.warning("HTTP/2 is enabled, but `h2` package is not installed. Falling back to HTTP/1.1.")
+    return available
 
 
 class InfraConfig(pydantic_settings.BaseSettings):
@@ -30,20 +138,121 @@ class InfraConfig(pydantic_settings.BaseSettings):
     queue_name: str = "notico-queue.fifo"
     queue_visibility_timeout_second: int = 2 * 60
     queue_max_receive_count: int = 5
+    queue_batch_size: int = 10  # FIFO queues allow up to 10 messages per batch
+    worker_max_group_concurrency: int = 10
     dlq_name: str = "notico-dlq.fifo"
     dlq_visibility_timeout_second: int = 2 * 60
+    # Stop starting new sends this many seconds before the message becomes visible again on the queue.
+    dispatch_deadline_margin_second: int = 10
+    # API Gateway responds with 504 after 29 seconds, so the send API stops starting new sends after this.
+    api_dispatch_deadline_second: float = 25
+
+    # "async" enqueues the requests of the send API to the queue, and responds without waiting for the sends.
+    # It can be chosen per request with the `mode` query parameter.
+    send_api_default_mode: SendAPIModeType = "sync"
+    # Messages in the same group are handled in order, one by one. "message" handles every message concurrently,
+    # "request" keeps the messages of a request in order, and "service" keeps all messages of a service in order.
+    enqueue_message_group_by: EnqueueMessageGroupByType = "message"
+    enqueue_max_recipients_per_message: int = 1000
+    # SQS allows up to 256KiB per message, and per batch request.
+    enqueue_max_message_byte: int = 256 * 1024
+    enqueue_max_concurrency: int = 4
+
+    # Creates the HTTP sessions of the configured services on Lambda init.
+    prewarm_sessions: bool = True
+
+    aws_max_pool_connections: int = 50
+    aws_connect_timeout_second: float = 3.0
+    aws_read_timeout_second: float = 10.0
+    aws_retry_mode: typing.Literal["legacy", "standard", "adaptive"] = "standard"
+    aws_max_attempts: int = 3
+
+    # Logs the time spent on imports and initialization once per container. See `chalicelib.util.coldstart_util`.
+    coldstart_report: bool = True
+    coldstart_report_top_n: int = 20
+
+    # Metrics are written as CloudWatch Embedded Metric Format logs. See `chalicelib.util.metric_util`.
+    metrics_enabled: bool = True
+    metrics_namespace: str = "NotiCo"
+    # "memory" keeps the metrics in the process, to check them offline.
+    metrics_sink: MetricSinkType = "stdout"
+    # Latency samples kept per metric per invocation. Samples more than this are reservoir-sampled.
+    metrics_max_samples: int = 500
+
+
+class CacheConfig(pydantic_settings.BaseSettings):
+    template_max_size: int = 256
+    template_ttl_second: float = 10 * 60
+
+    s3_max_size: int = 1024
+    s3_freshness_second: float = 30
+    s3_tmp_dir: str | None = None  # e.g. "/tmp/notico-s3-cache", to also keep the cached objects on disk
+    s3_fetch_max_concurrency: int = 10
+    # Keeps all templates of a service in a single index object, so that listing them needs only one GET.
+    s3_template_index: bool = False
+
+    toast_template_ttl_second: float = 5 * 60
+    # Unknown template codes are not looked up again until this expires, so that they don't call the API on every send.
+    toast_template_miss_ttl_second: float = 30
+    toast_template_snapshot_path: str | None = "/tmp/notico-toast-templates.json"  # nosec: B108
 
 
 class ServiceConfig(pydantic_settings.BaseSettings):
     timeout: float = 3.0
+    max_concurrency: int = 16
+
+    retry_count: int = 3
+    retry_base_delay_second: float = 0.2
+    retry_max_delay_second: float = 5.0
+    retry_budget_second: float = 30.0
+
+    rate_limit_per_second: float | None = None
+    rate_limit_burst: float | None = None
+    rate_limit_per_receiver_per_second: float | None = None
+    rate_limit_per_receiver_burst: float | None = None
+    rate_limit_backend: RateLimitBackendType = "local"
+    # Directory of the lock files for the "file" backend, or URL of the server for the "redis" backend.
+    rate_limit_backend_url: str | None = None
+
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 100
+    http_keepalive_expiry_second: float = 30.0
+    http2: bool = False
+    # Ratio of the requests to be logged. Failed responses are always logged.
+    http_log_sample_rate: float = 0.0
 
     def is_configured(self) -> bool:
-        target_fields = set(self.model_fields) - set(self.model_computed_fields)
+        # Fields of ServiceConfig are common tuning options which have defaults, so only check service specific ones.
+        target_fields = set(self.model_fields) - set(ServiceConfig.model_fields) - set(self.model_computed_fields)
         return all(getattr(self, field) for field in target_fields)
 
     def get_session(self) -> httpx.Client:
         raise NotImplementedError("This method must be implemented in the subclass.")
 
+    def get_async_session(self) -> httpx.AsyncClient:
+        raise NotImplementedError("This method must be implemented in the subclass.")
+
+    def prewarm(self) -> None:
+        """Opens the connections of the sessions on Lambda init, so that the first request doesn't pay for them."""
+        if self.is_configured():
+            open_connections(get_session=self.get_session, get_async_session=self.get_async_session)
+
+    def get_session_kwargs(self, is_async: bool = False) -> dict[str, typing.Any]:
+        req_hook, resp_hook = (log_request_async, log_response_async) if is_async else (log_request, log_response)
+        return {
+            "timeout": self.timeout,
+            "limits": httpx.Limits(
+                max_connections=self.http_max_connections,
+                max_keepalive_connections=self.http_max_keepalive_connections,
+                keepalive_expiry=self.http_keepalive_expiry_second,
+            ),
+            "http2": self.http2 and is_http2_available(),
+            "event_hooks": {
+                "request": [functools.partial(req_hook, sample_rate=self.http_log_sample_rate)],
+                "response": [functools.partial(resp_hook, sample_rate=self.http_log_sample_rate)],
+            },
+        }
+
 
 class ToastConfig(ServiceConfig, pydantic_settings.BaseSettings):
     domain: str | None = None
@@ -52,45 +261,185 @@ class ToastConfig(ServiceConfig, pydantic_settings.BaseSettings):
     secret_key: pydantic.SecretStr | None = None
     sender_key: pydantic.SecretStr | None = None
 
+    # Maximum number of the recipients in a single send request, which is limited by the Toast API.
+    recipient_chunk_size: int = 1000
+
     def get_base_url(self, service: AllowedToastServices) -> str:
         return urllib.parse.urljoin(self.domain, f"/{service}/{self.api_ver}/appkeys/{self.app_key}/")
 
-    def get_session(self, service: AllowedToastServices) -> httpx.Client:  # type: ignore[override]
-        return httpx.Client(
-            base_url=self.get_base_url(service),
-            headers={
-                "X-Secret-Key": self.secret_key.get_secret_value(),
-                "Content-Type": "application/json;charset=UTF-8",
-            },
-            timeout=self.timeout,
-            event_hooks={"request": [log_request], "response": [log_response]},
+    def get_headers(self) -> dict[str, str]:
+        return {"X-Secret-Key": self.secret_key.get_secret_value(), "Content-Type": "application/json;charset=UTF-8"}
+
+    def get_session(self, service: AllowedToastServices = "alimtalk") -> httpx.Client:  # type: ignore[override]
+        return get_shared_session(
+            key=f"toast:{service}",
+            factory=lambda: httpx.Client(
+                base_url=self.get_base_url(service), headers=self.get_headers(), **self.get_session_kwargs()
+            ),
+        )
+
+    def get_async_session(  # type: ignore[override]
+        self, service: AllowedToastServices = "alimtalk"
+    ) -> httpx.AsyncClient:
+        return get_shared_async_session(
+            key=f"toast:{service}",
+            factory=lambda: httpx.AsyncClient(
+                base_url=self.get_base_url(service),
+                headers=self.get_headers(),
+                **self.get_session_kwargs(is_async=True),
+            ),
         )
 
+    def prewarm(self) -> None:
+        if self.is_configured():
+            for service in typing.get_args(AllowedToastServices):
+                open_connections(
+                    get_session=functools.partial(self.get_session, service),
+                    get_async_session=functools.partial(self.get_async_session, service),
+                )
+
 
 class FirebaseConfig(ServiceConfig, pydantic_settings.BaseSettings):
+    # Content of the service account JSON file, or path to the file.
     certificate: pydantic.SecretStr | None = None
-    _app: firebase_admin.App | None = None
+    # This is the number of concurrent batch requests, as each batch request sends its messages concurrently.
+    max_concurrency: int = 2
+
+    _app: "firebase_admin.App | None" = None
+    _access_token: "firebase_admin.credentials.AccessTokenInfo | None" = None
 
     model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
 
-    def get_session(self) -> firebase_admin.App | None:  # type: ignore[override]
-        if not self._app:
-            with contextlib.suppress(ValueError):
-                credential = firebase_admin.credentials.Certificate(cert=self.certificate.get_secret_value())
-                self._app = firebase_admin.initialize_app(credential=credential)
+    # Firebase app is shared by the whole process, so these are not the configurable fields.
+    app_name: typing.ClassVar[str] = "notico"
+    token_refresh_margin: typing.ClassVar[datetime.timedelta] = datetime.timedelta(minutes=5)
+
+    def get_credential(self) -> "firebase_admin.credentials.Certificate":
+        import firebase_admin.credentials
+
+        cert = self.certificate.get_secret_value()
+        return firebase_admin.credentials.Certificate(cert=json.loads(cert) if cert.lstrip().startswith("{") else cert)
 
+    def get_session(self) -> "firebase_admin.App":  # type: ignore[override]
+        import firebase_admin
+
+        if not self._app:
+            with firebase_lock:
+                if not self._app:
+                    try:
+                        self._app = firebase_admin.get_app(name=self.app_name)
+                    except ValueError:
+                        self._app = firebase_admin.initialize_app(credential=self.get_credential(), name=self.app_name)
+
+        self.refresh_access_token()
         return self._app
 
+    def refresh_access_token(self, force: bool = False) -> None:
+        # Refresh the token before it expires, so that the token is not minted on sending messages.
+        # Google auth library uses naive UTC datetime for the expiry.
+        refresh_at = datetime.datetime.now(tz=datetime.UTC).replace(tzinfo=None) + self.token_refresh_margin
+        if not force and self._access_token and self._access_token.expiry > refresh_at:
+            return
+
+        with firebase_lock:
+            if force or not self._access_token or self._access_token.expiry <= refresh_at:
+                # This refreshes the Google credential which is used by the Firebase app in-place.
+                self._access_token = self._app.credential.get_access_token()
+
+
+class SESConfig(ServiceConfig, pydantic_settings.BaseSettings):
+    # Templates which only substitute variables are synced to SES templates, and sent with SendBulkTemplatedEmail.
+    bulk_mode: bool = False
+    # SES accepts up to 50 destinations per SendBulkTemplatedEmail request.
+    bulk_batch_size: int = pydantic.Field(default=50, ge=1, le=50)
+    template_name_prefix: str = "notico-"
+
+    def is_configured(self) -> bool:
+        # SES uses the credentials of the Lambda role, so there's nothing to be configured.
+        return True
+
+
+class GmailConfig(ServiceConfig, pydantic_settings.BaseSettings):
+    client_id: str | None = None
+    client_secret: pydantic.SecretStr | None = None
+    refresh_token: pydantic.SecretStr | None = None
+    # Address of the Google account which the refresh token is issued for.
+    user: str | None = None
+
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    # Maximum number of the authenticated SMTP connections, which also limits the number of concurrent sends.
+    smtp_pool_size: int = 4
+    # Connections which have been idle longer than this are checked with NOOP before being reused.
+    smtp_health_check_idle_second: float = 30.0
+    timeout: float = 30.0
+    max_concurrency: int = 4
+
+    _access_token: str | None = None
+    _access_token_expires_at: float = 0.0
+
+    token_url: typing.ClassVar[str] = "https://accounts.google.com/o/oauth2/token"
+    token_refresh_margin_second: typing.ClassVar[float] = 5 * 60
+
+    def is_configured(self) -> bool:
+        return bool(self.client_id and self.client_secret and self.refresh_token and self.user)
+
+    def get_session(self) -> httpx.Client:
+        return get_shared_session(key="gmail", factory=lambda: httpx.Client(**self.get_session_kwargs()))
+
+    def get_access_token(self, force: bool = False) -> str:
+        # Access token is valid for an hour, so it's refreshed only when it's about to expire.
+        if not force and self._access_token and time.time() < self._access_token_expires_at:
+            return self._access_token
+
+        with gmail_lock:
+            if force or not self._access_token or time.time() >= self._access_token_expires_at:
+                response = self.get_session().post(
+                    url=self.token_url,
+                    data={
+                        "client_id": self.client_id,
+                        "client_secret": self.client_secret.get_secret_value(),
+                        "refresh_token": self.refresh_token.get_secret_value(),
+                        "grant_type": "refresh_token",
+                    },
+                )
+                token = response.raise_for_status().json()
+                self._access_token = token["access_token"]
+                self._access_token_expires_at = time.time() + token["expires_in"] - self.token_refresh_margin_second
+        return self._access_token
+
 
 class TelegramConfig(ServiceConfig, pydantic_settings.BaseSettings):
     bot_token: pydantic.SecretStr | None = None
+    max_concurrency: int = 64
+
+    # https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+    rate_limit_per_second: float | None = 30
+    rate_limit_burst: float | None = 30
+    rate_limit_per_receiver_per_second: float | None = 1
+    rate_limit_per_receiver_burst: float | None = 1
+
+    def get_base_url(self) -> str:
+        return f"https://api.telegram.org/bot{self.bot_token.get_secret_value()}/"
 
     def get_session(self) -> httpx.Client:
-        return httpx.Client(
-            base_url=f"https://api.telegram.org/bot{self.bot_token.get_secret_value()}/",
-            headers={"Content-Type": "application/json;charset=UTF-8"},
-            timeout=self.timeout,
-            event_hooks={"request": [log_request], "response": [log_response]},
+        return get_shared_session(
+            key="telegram",
+            factory=lambda: httpx.Client(
+                base_url=self.get_base_url(),
+                headers={"Content-Type": "application/json;charset=UTF-8"},
+                **self.get_session_kwargs(),
+            ),
+        )
+
+    def get_async_session(self) -> httpx.AsyncClient:
+        return get_shared_async_session(
+            key="telegram",
+            factory=lambda: httpx.AsyncClient(
+                base_url=self.get_base_url(),
+                headers={"Content-Type": "application/json;charset=UTF-8"},
+                **self.get_session_kwargs(is_async=True),
+            ),
         )
 
 
@@ -98,15 +447,39 @@ class SlackConfig(ServiceConfig, pydantic_settings.BaseSettings):
     channel: str | None = None
     token: pydantic.SecretStr | None = None
 
+    # Logs are buffered and sent on the background thread. Logs are dropped when the buffer is full.
+    log_queue_size: int = 1000
+    log_batch_size: int = 10
+    log_batch_interval_second: float = 2.0
+    # Same errors within the window are sent only once. Set 0 to disable.
+    log_dedup_window_second: float = 60.0
+    # Number of distinct errors remembered for the deduplication. Expired ones are evicted when it's reached.
+    log_dedup_max_size: int = 1000
+    # Maximum time to wait for the buffered logs to be sent at the end of each invocation.
+    log_flush_timeout_second: float = 2.0
+
+    def is_configured(self) -> bool:
+        return bool(self.channel and self.token)
+
 
 class Config(pydantic_settings.BaseSettings):
     infra: InfraConfig = pydantic.Field(default_factory=InfraConfig)
+    cache: CacheConfig = pydantic.Field(default_factory=CacheConfig)
     toast: ToastConfig = pydantic.Field(default_factory=ToastConfig)
     firebase: FirebaseConfig = pydantic.Field(default_factory=FirebaseConfig)
+    ses: SESConfig = pydantic.Field(default_factory=SESConfig)
+    gmail: GmailConfig = pydantic.Field(default_factory=GmailConfig)
     slack: SlackConfig = pydantic.Field(default_factory=SlackConfig)
     telegram: TelegramConfig = pydantic.Field(default_factory=TelegramConfig)
 
     env_vars: dict[str, str] = pydantic.Field(default_factory=dict)
 
+    def prewarm_sessions(self) -> None:
+        for service_config in (self.toast, self.telegram):
+            try:
+                service_config.prewarm()
+            except Exception as e:
+                logger.warning(f"Failed to prewarm the session of {service_config.__class__.__name__}: {e}")
+
 
 config = Config(_env_nested_delimiter="__", _case_sensitive=False)
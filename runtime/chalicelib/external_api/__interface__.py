@@ -2,6 +2,7 @@ import functools
 import typing
 
 import chalicelib.config as config_module
+import chalicelib.util.decorator_util as decorator_util
 import chalicelib.util.type_util as type_util
 import httpx
 
@@ -14,8 +15,26 @@ class ExternalClientInterface:
         type_util.check_classvar_initialized(cls, ["exc_cls", "config"])
 
     @functools.cached_property
-    def session(self) -> httpx.Client:
+    def retry_policy(self) -> decorator_util.RetryPolicy:
+        return decorator_util.RetryPolicy(
+            retry_count=self.config.retry_count,
+            base_delay_second=self.config.retry_base_delay_second,
+            max_delay_second=self.config.retry_max_delay_second,
+            budget_second=self.config.retry_budget_second,
+        )
+
+    def check_configured(self) -> None:
         if not self.config.is_configured():
             raise self.exc_cls(f"{self.__class__.__name__} configuration is not set up properly.")
 
+    @property
+    def session(self) -> httpx.Client:
+        # Sessions are kept on the registry of the config module, so every client shares the same connection pool.
+        self.check_configured()
         return self.config.get_session()
+
+    @property
+    def async_session(self) -> httpx.AsyncClient:
+        # Shared on the registry of the config module per event loop, as httpx.AsyncClient is bound to the loop.
+        self.check_configured()
+        return self.config.get_async_session()
@@ -261,3 +261,9 @@ class TelegramBotMessagingClient(external_api_interface.ExternalClientInterface)
     def send_message(self, payload: TelegramSendMessageRequestPayload) -> str:
         response = self.session.post(url="/sendMessage", json=payload.model_dump(mode="json")).raise_for_status()
         return typing.cast(dict, typing.cast(dict, response.json()).get("result", {})).get("message_id", "")
+
+    @decorator_util.retry_async
+    async def send_message_async(self, payload: TelegramSendMessageRequestPayload) -> str:
+        response = await self.async_session.post(url="/sendMessage", json=payload.model_dump(mode="json"))
+        response.raise_for_status()
+        return typing.cast(dict, typing.cast(dict, response.json()).get("result", {})).get("message_id", "")
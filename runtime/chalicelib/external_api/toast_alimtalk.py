@@ -1,6 +1,5 @@
 # https://docs.nhncloud.com/ko/Notification/KakaoTalk%20Bizmessage/ko/alimtalk-api-guide/
 import datetime
-import functools
 import logging
 import typing
 import urllib.parse
@@ -245,19 +244,36 @@ class ToastAlimTalkClient(external_api_interface.ExternalClientInterface):
     exc_cls = ToastAlimTalkError
     config = config_module.config.toast
 
-    @functools.cached_property
+    @property
     def session(self) -> httpx.Client:
-        if not self.config.is_configured():
-            raise self.exc_cls("Toast configuration is not set up properly.")
-
+        self.check_configured()
         return self.config.get_session("alimtalk")
 
+    @property
+    def async_session(self) -> httpx.AsyncClient:
+        self.check_configured()
+        return self.config.get_async_session("alimtalk")
+
+    @staticmethod
+    def get_send_url(payload: MsgSendRequest | RawMsgSendRequest) -> str:
+        return "/messages" if payload.__class__ == MsgSendRequest else "/raw-messages"
+
+    def get_template_list_url(self, query_params: TemplateListQueryRequest | None = None) -> str:
+        query_str = urllib.parse.urlencode((query_params or TemplateListQueryRequest()).model_dump(exclude_none=True))
+        return f"/senders/{self.config.sender_key.get_secret_value()}/templates?{query_str}"
+
     @decorator_util.retry
     def send_alimtalk(self, payload: MsgSendRequest | RawMsgSendRequest) -> MsgSendResponse:
-        url = "/messages" if payload.__class__ == MsgSendRequest else "/raw-messages"
+        url = self.get_send_url(payload)
         response = self.session.post(url=url, json=payload.model_dump(mode="json")).raise_for_status()
         return MsgSendResponse.model_validate_json(response.read())
 
+    @decorator_util.retry_async
+    async def send_alimtalk_async(self, payload: MsgSendRequest | RawMsgSendRequest) -> MsgSendResponse:
+        url = self.get_send_url(payload)
+        response = (await self.async_session.post(url=url, json=payload.model_dump(mode="json"))).raise_for_status()
+        return MsgSendResponse.model_validate_json(await response.aread())
+
     @decorator_util.retry
     def get_template_categories(self) -> TemplateCategoriesResponse:
         url = "/template/categories"
@@ -265,10 +281,16 @@ class ToastAlimTalkClient(external_api_interface.ExternalClientInterface):
 
     @decorator_util.retry
     def get_template_list(self, query_params: TemplateListQueryRequest | None = None) -> TemplateListResponse:
-        query_str = urllib.parse.urlencode((query_params or TemplateListQueryRequest()).model_dump(exclude_none=True))
-        url = f"/senders/{self.config.sender_key.get_secret_value()}/templates?{query_str}"
+        url = self.get_template_list_url(query_params)
         return TemplateListResponse.model_validate_json(self.session.get(url=url).raise_for_status().read())
 
+    @decorator_util.retry_async
+    async def get_template_list_async(
+        self, query_params: TemplateListQueryRequest | None = None
+    ) -> TemplateListResponse:
+        response = (await self.async_session.get(url=self.get_template_list_url(query_params))).raise_for_status()
+        return TemplateListResponse.model_validate_json(await response.aread())
+
     @decorator_util.retry
     def delete_template(self, template_code: str) -> TemplateDeletionResponse:
         url = f"/senders/{self.config.sender_key.get_secret_value()}/templates/{template_code}"
@@ -1,5 +1,6 @@
 import dataclasses
 import logging
+import typing
 
 import chalicelib.logger.slack.formatter as slack_formatter
 import chalicelib.logger.slack.handler as slack_handler
@@ -11,9 +12,13 @@ class SlackLogger:
     token: str
     slack_logger_level: int = logging.WARNING
     logger: logging.Logger = dataclasses.field(default_factory=lambda: logging.getLogger("slack"))
+    handler_kwargs: dict[str, typing.Any] = dataclasses.field(default_factory=dict)
 
     def __post_init__(self) -> None:
-        handler = slack_handler.SlackHandler(channel=self.channel, token=self.token)
-        handler.setFormatter(slack_formatter.SlackJsonFormatter())
-        handler.setLevel(self.slack_logger_level)
-        self.logger.addHandler(handler)
+        self.handler = slack_handler.SlackHandler(channel=self.channel, token=self.token, **self.handler_kwargs)
+        self.handler.setFormatter(slack_formatter.SlackJsonFormatter())
+        self.handler.setLevel(self.slack_logger_level)
+        self.logger.addHandler(self.handler)
+
+    def flush(self, timeout_second: float | None = None) -> None:
+        self.handler.flush(timeout_second=timeout_second)
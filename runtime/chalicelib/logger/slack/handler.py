@@ -1,34 +1,193 @@
-import json
 import logging
 import logging.handlers
+import queue
+import threading
+import time
+import typing
 
+import chalicelib.logger.slack.block as block
+import httpx
 
-class SlackHandler(logging.handlers.HTTPHandler):
-    channel: str = ""
-    token: str = ""
+# Slack allows up to 50 blocks per message.
+SLACK_MAX_BLOCKS_PER_MESSAGE = 50
+SLACK_MAX_RETRY_AFTER_SECOND = 10.0
 
-    def __init__(self, channel: str, token: str) -> None:
-        super().__init__(host="slack.com", url="/api/chat.postMessage", method="POST", secure=True)
+SlackBlockType = dict[str, typing.Any]
+QueueItemType = tuple[logging.LogRecord, list[SlackBlockType]]
+
+
+class SlackHandler(logging.handlers.QueueHandler):
+    """
+    Formats the records on the calling thread, and sends them to Slack on the background thread in batches,
+    so that logging never waits for Slack. Records are dropped and counted if the buffer is full or Slack rejects them,
+    and the same errors within `dedup_window_second` are sent only once.
+    Call `flush` at the end of each invocation, as Lambda freezes the background thread after the response.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        token: str,
+        queue_size: int = 1000,
+        batch_size: int = 10,
+        batch_interval_second: float = 2.0,
+        dedup_window_second: float = 60.0,
+        dedup_max_size: int = 1000,
+        timeout_second: float = 5.0,
+        flush_timeout_second: float = 2.0,
+    ) -> None:
+        # Kept with its concrete type, as `QueueHandler.queue` is typed as the minimal queue protocol.
+        self.buffer: queue.Queue[QueueItemType] = queue.Queue(maxsize=queue_size)
+        super().__init__(queue=self.buffer)
         self.channel = channel
-        self.token = token
+        self.batch_size = batch_size
+        self.batch_interval_second = batch_interval_second
+        self.dedup_window_second = dedup_window_second
+        self.dedup_max_size = dedup_max_size
+        self.flush_timeout_second = flush_timeout_second
+        # The connection is kept open between messages.
+        self.client = httpx.Client(
+            base_url="https://slack.com/api",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=timeout_second,
+        )
+
+        self.dropped_count = 0
+        self.suppressed_count = 0
+        self._last_seen_at: dict[typing.Hashable, float] = {}
+        self._flush_requested = threading.Event()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+
+    @staticmethod
+    def get_dedup_key(record: logging.LogRecord) -> typing.Hashable:
+        exc_type = record.exc_info[0] if record.exc_info else None
+        return (record.levelno, record.pathname, record.lineno, record.msg, exc_type)
+
+    def is_duplicated(self, record: logging.LogRecord) -> bool:
+        # Called on `emit`, which is serialized by the handler lock.
+        now = time.monotonic()
+        if len(self._last_seen_at) >= self.dedup_max_size:
+            self._last_seen_at = {k: v for k, v in self._last_seen_at.items() if now - v < self.dedup_window_second}
 
-    def mapLogRecord(self, record: logging.LogRecord) -> dict[str, str]:
-        return {
-            "text": "NotiCo Logging",
-            "channel": self.channel,
-            "blocks": self.formatter.format(record),
-        }
+        key = self.get_dedup_key(record)
+        if (last_seen_at := self._last_seen_at.get(key)) is not None and now - last_seen_at < self.dedup_window_second:
+            return True
+        self._last_seen_at[key] = now
+        return False
+
+    def prepare(self, record: logging.LogRecord) -> QueueItemType:  # type: ignore[override]
+        # Formatted here, as the arguments and the traceback of the record may be changed after the call.
+        return record, typing.cast(list[SlackBlockType], self.format(record))
+
+    def enqueue(self, record: QueueItemType) -> None:  # type: ignore[override]
+        try:
+            self.buffer.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
 
     def emit(self, record: logging.LogRecord) -> None:
-        """From the logging.handlers.HTTPHandler.emit, but with some modifications to send a message to Slack."""
+        if self.dedup_window_second > 0 and self.is_duplicated(record):
+            self.suppressed_count += 1
+            return
+
+        self.start()
+        super().emit(record)
+
+    def start(self) -> None:
+        if self._worker and self._worker.is_alive():
+            return
+
+        with self._worker_lock:
+            if not (self._worker and self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name="notico-slack-log", daemon=True)
+                self._worker.start()
+
+    def _get_batch(self) -> list[QueueItemType]:
+        batch: list[QueueItemType] = [self.buffer.get()]
+        block_count = len(batch[0][1])
+        send_at = time.monotonic() + self.batch_interval_second
+
+        while len(batch) < self.batch_size and block_count < SLACK_MAX_BLOCKS_PER_MESSAGE:
+            # Once the batch is due, only the records already in the queue are added to the batch.
+            is_due = self._flush_requested.is_set() or (remaining := send_at - time.monotonic()) <= 0
+            try:
+                item = self.buffer.get_nowait() if is_due else self.buffer.get(timeout=min(remaining, 0.1))
+            except queue.Empty:
+                if is_due:
+                    break
+                continue
+
+            batch.append(item)
+            block_count += len(item[1])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._get_batch()
+            try:
+                self.send(batch)
+            except Exception:
+                self.handleError(batch[-1][0])
+            finally:
+                for _ in batch:
+                    self.buffer.task_done()
+
+    def get_summary_block(self) -> SlackBlockType | None:
+        # Counters are increased on `emit` under the handler lock, so they're taken under the lock too.
+        with self.lock:
+            dropped_count, self.dropped_count = self.dropped_count, 0
+            suppressed_count, self.suppressed_count = self.suppressed_count, 0
+        if not (dropped_count or suppressed_count):
+            return None
+
+        text = f"{dropped_count} log(s) dropped, {suppressed_count} duplicated log(s) skipped"
+        return block.SlackSectionParentBlock(text=block.SlackPlainTextChildBlock(text=text)).to_dict()
+
+    def send(self, batch: list[QueueItemType]) -> None:
+        blocks: list[SlackBlockType] = []
+        record_start_indexes: list[int] = []
+        for _, record_blocks in batch:
+            record_start_indexes.append(len(blocks))
+            blocks.extend(record_blocks)
+        if summary_block := self.get_summary_block():
+            blocks.append(summary_block)
+
+        for start in range(0, len(blocks), SLACK_MAX_BLOCKS_PER_MESSAGE):
+            end = start + SLACK_MAX_BLOCKS_PER_MESSAGE
+            payload = {"text": "NotiCo Logging", "channel": self.channel, "blocks": blocks[start:end]}
+            response = self.client.post("/chat.postMessage", json=payload)
+            if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+                retry_after = float(response.headers.get("Retry-After", 1))
+                time.sleep(min(retry_after, SLACK_MAX_RETRY_AFTER_SECOND))
+                response = self.client.post("/chat.postMessage", json=payload)
+            response.raise_for_status()
+
+            # Slack responds with 200 even when the message is rejected, and tells it with `ok` on the body.
+            if not response.json().get("ok"):
+                with self.lock:
+                    self.dropped_count += sum(start <= i < end for i in record_start_indexes)
+
+    def flush(self, timeout_second: float | None = None) -> None:
+        """
+        Waits until the queued records are sent, at most `timeout_second` seconds (`flush_timeout_second` if not given),
+        so that `logging.shutdown` doesn't hang the invocation when Slack is unreachable.
+        """
+        if not self._worker:
+            return
+
+        end_at = time.monotonic() + (self.flush_timeout_second if timeout_second is None else timeout_second)
+        self._flush_requested.set()
         try:
-            connection = self.getConnection(self.host, self.secure)
-            connection.request(
-                method=self.method,
-                url=self.url,
-                body=json.dumps(self.mapLogRecord(record)).encode("utf-8"),
-                headers={"Content-type": "application/json", "Authorization": f"Bearer {self.token}"},
-            )
-            connection.getresponse()
-        except Exception:
-            self.handleError(record)
+            with self.buffer.all_tasks_done:
+                while self.buffer.unfinished_tasks:
+                    if (remaining := end_at - time.monotonic()) <= 0:
+                        break
+                    self.buffer.all_tasks_done.wait(timeout=remaining)
+        finally:
+            self._flush_requested.clear()
+
+    def close(self) -> None:
+        self.flush(timeout_second=self.batch_interval_second)
+        self.client.close()
+        super().close()
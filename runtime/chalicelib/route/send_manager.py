@@ -2,9 +2,11 @@ import typing
 
 import chalice
 import chalice.app
+import chalicelib.config as config_module
 import chalicelib.send_manager as send_manager
-import chalicelib.send_manager.__interface__ as send_mgr_interface
 import chalicelib.util.chalice_util as chalice_util
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.worker.notification_sender as notification_sender
 
 send_manager_api = chalice.app.Blueprint(__name__)
 send_manager_api.url_prefix = "send-manager"
@@ -18,17 +20,34 @@ def list_send_manager_services() -> list[dict[str, str | bool | dict]]:
 
 
 @send_manager_api.route("/{service_name}", methods=["POST"])
-@chalice_util.api_gateway_desc(summary="Send message", description="Send message using the service")
+@chalice_util.api_gateway_desc(
+    summary="Send message",
+    description=(
+        "Send message using the service. With `mode=async` query parameter, "
+        "the request is enqueued and responded with 202 and the tracking ID, without waiting for the sends."
+    ),
+)
 @chalice_util.exception_catcher
-def send_message(service_name: str) -> dict[str, str | None]:
+def send_message(service_name: str) -> dict[str, str | None] | chalice.app.Response:
     request: chalice.app.Request = send_manager_api.current_request
-    if not (payload := typing.cast(dict[str, str] | None, request.json_body)):
+    if not (raw_body := request.raw_body):
         raise chalice.BadRequestError("Payload not given")
 
     if not (send_mgr := send_manager.send_managers.get(service_name, None)):
         raise chalice.NotFoundError(f"Service {service_name} not found")
 
-    return send_mgr.send(request=send_mgr_interface.SendRequest.model_validate(payload))
+    # Parsed from the raw body directly, so that the large payload is not decoded as Python objects twice.
+    request_payload = send_mgr.send_request_cls.model_validate_json(raw_body)
+
+    mode = request.query_params.get("mode") if request.query_params else None
+    mode = mode or config_module.config.infra.send_api_default_mode
+    if mode not in typing.get_args(config_module.SendAPIModeType):
+        raise chalice.BadRequestError(f"Mode {mode} is not supported")
+    if mode == "async":
+        enqueue_result = notification_sender.enqueue(service_name=service_name, request=request_payload)
+        return chalice.app.Response(status_code=202, body=enqueue_result.model_dump(mode="json"))
+    with concurrency_util.deadline_scope(remaining_second=config_module.config.infra.api_dispatch_deadline_second):
+        return concurrency_util.run_coroutine(send_mgr.send_async(request=request_payload))
 
 
 blueprints: list[chalice.app.Blueprint] = [send_manager_api]
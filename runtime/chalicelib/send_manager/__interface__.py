@@ -1,11 +1,33 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import typing
 
+import botocore.exceptions
+import chalicelib.config as config_module
 import chalicelib.template_manager.__interface__ as template_mgr_interface
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.util.metric_util as metric_util
+import chalicelib.util.ratelimit_util as ratelimit_util
 import chalicelib.util.type_util as type_util
+import httpx
 import pydantic
 
+DispatchArgType = typing.TypeVar("DispatchArgType")
+DEADLINE_EXCEEDED_RESULT_CODE = "DeadlineExceeded"
+
+
+def get_result_code(exc: BaseException) -> str:
+    """Returns the result code of the metrics for the failed send, e.g. the HTTP status or the AWS error code."""
+    # Client errors are wrapped by the retry decorator, so unwrap them to get the original error.
+    cause = exc.__cause__ or exc
+    if isinstance(cause, httpx.HTTPStatusError):
+        return str(cause.response.status_code)
+    if isinstance(cause, botocore.exceptions.ClientError):
+        return cause.response.get("Error", {}).get("Code", type(cause).__name__)
+    return type(cause).__name__
+
 
 class SendRequest(pydantic.BaseModel):
     template_code: str
@@ -16,12 +38,13 @@ class SendRequest(pydantic.BaseModel):
 class SendManagerInterface:
     service_name: typing.ClassVar[str]
     template_manager: typing.ClassVar[template_mgr_interface.TemplateManagerInterface]
-    send_request_cls: typing.ClassVar[type[SendRequest]]
+    send_request_cls: typing.ClassVar[type[SendRequest]] = SendRequest
+    config: typing.ClassVar[config_module.ServiceConfig]
 
     initialized: typing.ClassVar[bool]
 
     def __init_subclass__(cls) -> None:
-        type_util.check_classvar_initialized(cls, ["service_name", "template_manager"])
+        type_util.check_classvar_initialized(cls, ["service_name", "template_manager", "config"])
 
     def describe(self) -> dict[str, typing.Any]:
         return {
@@ -31,3 +54,76 @@ class SendManagerInterface:
 
     def send(self, request: SendRequest) -> dict[str, str | None]:
         raise NotImplementedError("This method must be implemented in the subclass.")
+
+    async def send_async(self, request: SendRequest) -> dict[str, str | None]:
+        # Services without the async client are sent on the thread, so that they don't block the event loop.
+        return await asyncio.to_thread(self.send, request)
+
+    def record_result(self, result_code: str | int, count: int = 1) -> None:
+        metric_util.metrics.increment("SendResultCount", count, Service=self.service_name, ResultCode=str(result_code))
+
+    def record_deadline_exceeded(self, results: dict[str, str]) -> None:
+        """`results` must be keyed by the receivers, so that the not sent receivers are counted."""
+        if count := sum(result == concurrency_util.DEADLINE_EXCEEDED_RESULT for result in results.values()):
+            self.record_result(DEADLINE_EXCEEDED_RESULT_CODE, count)
+
+    @functools.cached_property
+    def rate_limiter(self) -> ratelimit_util.RateLimiter:
+        return ratelimit_util.RateLimiter.from_config(name=self.service_name, config=self.config)
+
+    def dispatch(
+        self,
+        func: typing.Callable[[str, DispatchArgType], str],
+        items: typing.Iterable[tuple[str, DispatchArgType]],
+        per_key_rate_limit: bool = True,
+        get_cost: typing.Callable[[DispatchArgType], int] | None = None,
+    ) -> dict[str, str]:
+        """
+        `per_key_rate_limit` must be False if the key is not a receiver, and `get_cost` returns the number of
+        the global rate limit tokens of an item, if an item is sent to multiple receivers on a single request.
+        Receivers not sent by the deadline are recorded on the metrics only if the keys are receivers,
+        so the callers sending multiple receivers per item must record them with `record_deadline_exceeded`.
+        """
+
+        def dispatched_func(key: str, arg: DispatchArgType) -> str:
+            if self.rate_limiter.enabled:
+                self.rate_limiter.wait(key=key if per_key_rate_limit else None, count=get_cost(arg) if get_cost else 1)
+                if concurrency_util.get_remaining_second() <= 0:
+                    return concurrency_util.DEADLINE_EXCEEDED_RESULT
+            with metric_util.metrics.timer("SendLatency", Service=self.service_name):
+                return func(key, arg)
+
+        results = concurrency_util.dispatch_threaded(
+            func=dispatched_func,
+            items=items,
+            max_concurrency=self.config.max_concurrency,
+        )
+        if per_key_rate_limit:
+            self.record_deadline_exceeded(results)
+        return results
+
+    async def dispatch_async(
+        self,
+        func: typing.Callable[[str, DispatchArgType], typing.Awaitable[str]],
+        items: typing.Iterable[tuple[str, DispatchArgType]],
+        per_key_rate_limit: bool = True,
+        get_cost: typing.Callable[[DispatchArgType], int] | None = None,
+    ) -> dict[str, str]:
+        async def dispatched_func(key: str, arg: DispatchArgType) -> str:
+            if self.rate_limiter.enabled:
+                await self.rate_limiter.wait_async(
+                    key=key if per_key_rate_limit else None, count=get_cost(arg) if get_cost else 1
+                )
+                if concurrency_util.get_remaining_second() <= 0:
+                    return concurrency_util.DEADLINE_EXCEEDED_RESULT
+            with metric_util.metrics.timer("SendLatency", Service=self.service_name):
+                return await func(key, arg)
+
+        results = await concurrency_util.dispatch_async(
+            func=dispatched_func,
+            items=items,
+            max_concurrency=self.config.max_concurrency,
+        )
+        if per_key_rate_limit:
+            self.record_deadline_exceeded(results)
+        return results
@@ -1,21 +1,30 @@
+import collections
+import itertools
+import json
 import traceback
+import typing
 
 import botocore.exceptions
 import chalicelib.aws_resource as aws_resource_module
+import chalicelib.config as config_module
 import chalicelib.send_manager.__interface__ as sendmgr_interface
 import chalicelib.template_manager.aws_ses as aws_ses_template_mgr
+import chalicelib.util.type_util as type_util
+
+DestinationsType = tuple[tuple[str, type_util.ContextType], ...]
 
 
 class AWSSESSendManager(sendmgr_interface.SendManagerInterface):
     template_manager = aws_ses_template_mgr.aws_ses_template_manager
     send_request_cls = sendmgr_interface.SendRequest
+    config = config_module.config.ses
 
     service_name = "aws_ses"
     initialized = True
 
     def _send_email(self, from_: str, to_: str, title: str, body: str) -> str:
         try:
-            return aws_resource_module.ses_client.send_email(
+            message_id = aws_resource_module.ses_client.send_email(
                 Source=from_,
                 # Because if you send it to multiple people at once,
                 # the e-mail addresses of the people you send with might be exposed to each other.
@@ -26,26 +35,99 @@ class AWSSESSendManager(sendmgr_interface.SendManagerInterface):
                     "Body": {"Html": {"Charset": "UTF-8", "Data": body}},
                 },
             )["MessageId"]
+            self.record_result("Success")
+            return message_id
         except Exception as e:
+            self.record_result(sendmgr_interface.get_result_code(e))
             err_tb = "\n".join(traceback.format_exception(e))
-            if isinstance(e, botocore.exceptions.HTTPClientError):
+            if isinstance(e, botocore.exceptions.ClientError):
                 return e.response.get("Error", {}).get("Message", err_tb)
             return err_tb
 
-    def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
-        result: dict[str, str] = {}
-
-        for receiver, personalized_context in request.personalized_context.items():
-            context = request.shared_context | personalized_context
-            render_result = self.template_manager.render(template_code=request.template_code, context=context)
-            result[receiver] = self._send_email(
-                from_=render_result["from_"],
-                to_=receiver,
-                title=render_result["title"],
-                body=render_result["body"],
+    def _send_rendered_email(self, to_: str, render_result: dict[str, str]) -> str:
+        return self._send_email(
+            from_=render_result["from_"],
+            to_=to_,
+            title=render_result["title"],
+            body=render_result["body"],
+        )
+
+    def send_bulk(
+        self, request: sendmgr_interface.SendRequest, bulk_template: aws_ses_template_mgr.SESBulkTemplate
+    ) -> dict[str, str]:
+        # Every destination gets its own e-mail, so the addresses are not exposed to each other.
+        # Variables which are not given are filled once on the default data, and each destination only overrides them.
+        default_context = dict(request.shared_context)
+        self.template_manager.fill_not_defined_variables(bulk_template.variables, default_context, "random")
+        default_data = {k: str(default_context.get(k, "")) for k in bulk_template.variables}
+        source = bulk_template.from_.template.render(default_context)
+
+        batches: dict[str, DestinationsType] = {
+            str(index): destinations
+            for index, destinations in enumerate(
+                itertools.batched(request.personalized_context.items(), self.config.bulk_batch_size)
             )
+        }
+        results: dict[str, str] = {}
+
+        def _send_batch(batch_key: str, destinations: DestinationsType) -> str:
+            try:
+                response = aws_resource_module.get_client("ses").send_bulk_templated_email(
+                    Source=source,
+                    Template=typing.cast(str, bulk_template.name),
+                    DefaultTemplateData=json.dumps(default_data, ensure_ascii=False),
+                    Destinations=[
+                        {
+                            "Destination": {"ToAddresses": [to_]},
+                            "ReplacementTemplateData": json.dumps(
+                                {k: str(v) for k, v in context.items() if k in bulk_template.variables},
+                                ensure_ascii=False,
+                            ),
+                        }
+                        for to_, context in destinations
+                    ],
+                )
+            except botocore.exceptions.ClientError as e:
+                self.record_result(sendmgr_interface.get_result_code(e), len(destinations))
+                # The error is copied to every destination of the batch, so keep it short.
+                return e.response.get("Error", {}).get("Message", repr(e))
+
+            # Statuses are returned in the same order as the destinations.
+            for (to_, _), status in zip(destinations, response["Status"], strict=False):
+                is_success = status["Status"] == "Success"
+                results[to_] = status["MessageId"] if is_success else f"{status['Status']}: {status.get('Error', '')}"
+            for result_code, count in collections.Counter(status["Status"] for status in response["Status"]).items():
+                self.record_result(result_code, count)
+            return ""
+
+        batch_results = self.dispatch(
+            func=_send_batch,
+            items=batches.items(),
+            per_key_rate_limit=False,
+            get_cost=len,
+        )
+
+        for batch_key, destinations in batches.items():
+            for to_, _ in destinations:
+                results.setdefault(to_, batch_results[batch_key])
+        self.record_deadline_exceeded(results)
+        return results
+
+    def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
+        if self.config.bulk_mode and (bulk_template := self.template_manager.get_bulk_template(request.template_code)):
+            personalized_keys: set[str] = set().union(*request.personalized_context.values())
+            # Sender must be same for all destinations of a bulk request.
+            if bulk_template.name and not bulk_template.from_.variables & personalized_keys:
+                return self.send_bulk(request=request, bulk_template=bulk_template)
 
-        return result
+        return self.dispatch(
+            func=self._send_rendered_email,
+            items=self.template_manager.render_many(
+                template_code=request.template_code,
+                shared_context=request.shared_context,
+                personalized_contexts=request.personalized_context,
+            ),
+        )
 
 
 aws_ses_send_manager = AWSSESSendManager()
@@ -1,17 +1,28 @@
+import collections
 import contextlib
 import datetime
+import itertools
 import json
 import logging
+import traceback
 import typing
 
 import chalicelib.config as config_module
+import chalicelib.send_manager.__interface__ as sendmgr_interface
+import chalicelib.template_manager.firebase_cloudmessaging as firebase_template_mgr
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.util.metric_util as metric_util
 import firebase_admin
-import firebase_admin.credentials
 import firebase_admin.messaging
 import pydantic
 
 logger = logging.getLogger(__name__)
 
+# FCM allows up to 500 messages per a batch request.
+FCM_MAX_BATCH_SIZE = 500
+UNREGISTERED_TOKEN_RESULT_PREFIX = "UNREGISTERED: "
+DEFAULT_DATA = {"click_action": "FLUTTER_NOTIFICATION"}
+
 
 def _stringify_data(data: typing.Any) -> str:
     with contextlib.suppress(Exception):
@@ -39,7 +50,7 @@ def _jsonify_data(data: dict[typing.Any, typing.Any]) -> dict[str, str]:
 class FirebaseCloudMessaging(pydantic.BaseModel):
     title: str = ""
     body: str = ""
-    data: dict = pydantic.Field(default={"click_action": "FLUTTER_NOTIFICATION"})
+    data: dict = pydantic.Field(default=DEFAULT_DATA)
 
     topic: str | None = None
     target_tokens: list[str] | None = None
@@ -86,18 +97,93 @@ class FirebaseCloudMessaging(pydantic.BaseModel):
             for target_token in self.target_tokens
         ]
 
-    def send(self) -> str:
-        if not config_module.config.firebase.is_configured():
-            raise ValueError("Firebase configuration is not set up properly.")
+    def send(self) -> dict[str, str]:
+        return firebase_cloudmessaging_send_manager.send_messages(zip(self.target_tokens, self.message_payloads))
+
+
+class FirebaseCloudMessagingSendManager(sendmgr_interface.SendManagerInterface):
+    template_manager = firebase_template_mgr.firebase_cloudmessaging_template_manager
+    send_request_cls = sendmgr_interface.SendRequest
+    config = config_module.config.firebase
 
-        with contextlib.suppress(ValueError):
-            firebase_admin.initialize_app(
-                credential=firebase_admin.credentials.Certificate(
-                    cert=config_module.config.firebase.certificate.get_secret_value(),
+    service_name = "firebase_cloudmessaging"
+    initialized = config_module.config.firebase.is_configured()
+
+    @staticmethod
+    def is_unregistered_token_result(result: str) -> bool:
+        return result.startswith(UNREGISTERED_TOKEN_RESULT_PREFIX)
+
+    @classmethod
+    def get_unregistered_tokens(cls, results: dict[str, str]) -> list[str]:
+        """Returns tokens which are not valid anymore, so that callers can remove them from their storage."""
+        return [token for token, result in results.items() if cls.is_unregistered_token_result(result)]
+
+    @staticmethod
+    def _get_result(response: firebase_admin.messaging.SendResponse) -> str:
+        if response.success:
+            return response.message_id
+        if isinstance(response.exception, firebase_admin.messaging.UnregisteredError):
+            return f"{UNREGISTERED_TOKEN_RESULT_PREFIX}{response.exception}"
+        return str(response.exception)
+
+    def _send_batch(self, messages: tuple[tuple[str, firebase_admin.messaging.Message], ...]) -> dict[str, str]:
+        if concurrency_util.get_remaining_second() <= 0:
+            self.record_result(sendmgr_interface.DEADLINE_EXCEEDED_RESULT_CODE, len(messages))
+            return {token: concurrency_util.DEADLINE_EXCEEDED_RESULT for token, _ in messages}
+
+        try:
+            with metric_util.metrics.timer("SendLatency", Service=self.service_name):
+                batch_response = firebase_admin.messaging.send_each(
+                    messages=[message for _, message in messages],
+                    app=self.config.get_session(),
                 )
+        except Exception as e:
+            self.record_result(sendmgr_interface.get_result_code(e), len(messages))
+            err_tb = "".join(traceback.format_exception(e))
+            return {token: err_tb for token, _ in messages}
+
+        result_codes = collections.Counter(
+            "Success" if r.success else type(r.exception).__name__ for r in batch_response.responses
+        )
+        for result_code, count in result_codes.items():
+            self.record_result(result_code, count)
+        logger.info(f"FCM batch sent: {batch_response.success_count=}, {batch_response.failure_count=}")
+        return {token: self._get_result(r) for (token, _), r in zip(messages, batch_response.responses)}
+
+    def send_messages(self, messages: typing.Iterable[tuple[str, firebase_admin.messaging.Message]]) -> dict[str, str]:
+        if not self.config.is_configured():
+            raise ValueError("Firebase configuration is not set up properly.")
+
+        # send_each sends messages of a batch concurrently by itself, so we only need to run a few batches at once.
+        results: dict[str, str] = {}
+        for batch_result in concurrency_util.map_threaded(
+            func=self._send_batch,
+            items=itertools.batched(messages, FCM_MAX_BATCH_SIZE),
+            max_concurrency=self.config.max_concurrency,
+        ):
+            results.update(batch_result)
+        return results
+
+    def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
+        return self.send_messages(
+            (
+                token,
+                firebase_admin.messaging.Message(
+                    data=DEFAULT_DATA,
+                    notification=firebase_admin.messaging.Notification(
+                        title=render_result["title"],
+                        body=render_result["body"],
+                    ),
+                    token=token,
+                ),
             )
+            for token, render_result in self.template_manager.render_many(
+                template_code=request.template_code,
+                shared_context=request.shared_context,
+                personalized_contexts=request.personalized_context,
+            )
+        )
+
 
-        # response is a message ID string.
-        response: str = firebase_admin.messaging.send_all(self.message_payloads)
-        logger.info(f"Successfully sent message: {response}")
-        return response
+firebase_cloudmessaging_send_manager = FirebaseCloudMessagingSendManager()
+send_managers = [firebase_cloudmessaging_send_manager]
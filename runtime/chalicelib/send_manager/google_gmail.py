@@ -1,15 +1,23 @@
-import base64
+import contextlib
+import email.message
+import email.utils
+import functools
 import imaplib
+import queue
 import smtplib
+import ssl
+import threading
+import time
+import traceback
+import typing
 import urllib.parse
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 
+import chalicelib.config as config_module
+import chalicelib.send_manager.__interface__ as sendmgr_interface
+import chalicelib.template_manager.aws_ses as aws_ses_template_mgr
 import httpx
 import pydantic
 
-# import lxml.html
-
 GOOGLE_ACCOUNTS_BASE_URL = "https://accounts.google.com"
 GMAIL_DEFAULT_SCOPE = "https://mail.google.com/"
 REDIRECT_URI = "urn:ietf:wg:oauth:2.0:oob"
@@ -36,84 +44,154 @@ class GmailIMAP(pydantic.BaseModel):
         conn.select("INBOX")
 
 
-class GmailSMTP(pydantic.BaseModel):
-    host: str = "smtp.gmail.com"
-    port: int = 587
-    client_id: str
-    auth_string: str  # TODO: Should rename this
-
-    debug: bool = False
+class GmailSMTPPool:
+    """
+    Pool of the authenticated SMTP connections, so that the TLS handshake and the authentication are done only once
+    per connection instead of once per message. At most `smtp_pool_size` connections are used at the same time.
+    """
+
+    def __init__(self, config: config_module.GmailConfig) -> None:
+        self.config = config
+        # Most recently used connection first, so that the rarely used connections are closed by the server.
+        self._idle: queue.LifoQueue[tuple[smtplib.SMTP, float]] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(config.smtp_pool_size)
+
+    def _authenticate(self, conn: smtplib.SMTP, access_token: str) -> None:
+        auth_string = f"user={self.config.user}\x01auth=Bearer {access_token}\x01\x01"
+        # On failure, the server sends the error as a challenge, and expects an empty response.
+        conn.auth("XOAUTH2", lambda challenge=None: "" if challenge else auth_string)
+
+    def connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(host=self.config.smtp_host, port=self.config.smtp_port, timeout=self.config.timeout)
+        try:
+            conn.starttls(context=ssl.create_default_context())
+            try:
+                self._authenticate(conn, self.config.get_access_token())
+            except smtplib.SMTPAuthenticationError:
+                # The access token may be revoked before its expiry, so retry once with the new one.
+                self._authenticate(conn, self.config.get_access_token(force=True))
+        except BaseException:
+            self.close_connection(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def close_connection(conn: smtplib.SMTP) -> None:
+        with contextlib.suppress(smtplib.SMTPException, OSError):
+            conn.quit()
+        conn.close()
+
+    @staticmethod
+    def is_connection_broken(e: BaseException) -> bool:
+        # SMTPException is a subclass of OSError, but most of them are the errors of a message, not a connection.
+        return isinstance(e, smtplib.SMTPServerDisconnected) or (
+            isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+        )
 
-    @pydantic.field_validator("auth_string", mode="after")
-    @classmethod
-    def validate_auth_string(cls, v: str) -> str:
-        return base64.b64encode(v.encode("ascii")).decode("ascii")
-
-    def get_connection(self) -> smtplib.SMTP:
-        smtp_conn = smtplib.SMTP(self.host, self.port)
-        smtp_conn.set_debuglevel(self.debug)
-        smtp_conn.ehlo(self.client_id)
-        smtp_conn.starttls()
-        f"XOAUTH2 {self.auth_string}"
-        smtp_conn.docmd("AUTH", f"XOAUTH2 {self.auth_string}")
-        return smtp_conn
+    def _get_connection(self) -> smtplib.SMTP:
+        while True:
+            try:
+                conn, last_used_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+
+            if time.monotonic() - last_used_at < self.config.smtp_health_check_idle_second:
+                return conn
+            with contextlib.suppress(smtplib.SMTPException, OSError):
+                if conn.noop()[0] == 250:
+                    return conn
+            self.close_connection(conn)
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[smtplib.SMTP]:
+        with self._slots:
+            conn = self._get_connection()
+            try:
+                yield conn
+            except BaseException as e:
+                if self.is_connection_broken(e):
+                    self.close_connection(conn)
+                    raise
+                self._idle.put((conn, time.monotonic()))
+                raise
+            self._idle.put((conn, time.monotonic()))
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.close_connection(conn)
+
+
+class GmailSendManager(sendmgr_interface.SendManagerInterface):
+    # Gmail uses the same e-mail templates as AWS SES.
+    template_manager = aws_ses_template_mgr.aws_ses_template_manager
+    config = config_module.config.gmail
+
+    service_name = "google_gmail"
+    initialized = config_module.config.gmail.is_configured()
+
+    @functools.cached_property
+    def smtp_pool(self) -> GmailSMTPPool:
+        return GmailSMTPPool(config=self.config)
+
+    @staticmethod
+    def build_message(from_: str, to_: str, title: str, body: str) -> email.message.EmailMessage:
+        message = email.message.EmailMessage()
+        message["Subject"] = title
+        message["From"] = from_
+        message["To"] = to_
+        message["Message-ID"] = email.utils.make_msgid()
+        message.set_content(body, subtype="html", charset="utf-8")
+        return message
+
+    def _send_email(self, from_: str, to_: str, title: str, body: str) -> str:
+        message = self.build_message(from_=from_, to_=to_, title=title, body=body)
+        try:
+            try:
+                with self.smtp_pool.connection() as conn:
+                    conn.send_message(message, from_addr=from_, to_addrs=[to_])
+            except smtplib.SMTPServerDisconnected:
+                # Idle connection may be closed by the server without noticing, so retry once on the new connection.
+                with self.smtp_pool.connection() as conn:
+                    conn.send_message(message, from_addr=from_, to_addrs=[to_])
+            self.record_result(250)
+            return message["Message-ID"]
+        except Exception as e:
+            if isinstance(e, smtplib.SMTPRecipientsRefused):
+                for code, _ in e.recipients.values():
+                    self.record_result(code)
+                return "; ".join(f"{code} {msg.decode(errors='replace')}" for code, msg in e.recipients.values())
+            if isinstance(e, smtplib.SMTPResponseException):
+                self.record_result(e.smtp_code)
+                smtp_error = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else e.smtp_error
+                return f"{e.smtp_code} {smtp_error}"
+            self.record_result(sendmgr_interface.get_result_code(e))
+            return "\n".join(traceback.format_exception(e))
+
+    def _send_rendered_email(self, to_: str, render_result: dict[str, str]) -> str:
+        return self._send_email(
+            from_=render_result["from_"],
+            to_=to_,
+            title=render_result["title"],
+            body=render_result["body"],
+        )
 
-    @classmethod
-    def test(cls, auth_string: str) -> None:
-        with cls(client_id="test", auth_string=auth_string).get_connection():
-            pass
-
-    def sendmail(self, from_addr: str, to_addrs: list[str], msg: str) -> None:
-        with self.get_connection() as conn:
-            conn.sendmail(from_addr=from_addr, to_addrs=to_addrs, msg=msg)
-
-
-def send_mail(
-    client_id: str,
-    client_secret: str,
-    refresh_token: str,
-    fromaddr: str,
-    toaddr: str,
-    subject: str,
-    message: str,
-    debug: bool = False,
-) -> None:
-    access_token = (
-        httpx.post(
-            url=f"{GOOGLE_ACCOUNTS_BASE_URL}/o/oauth2/token",
-            content={
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "refresh_token": refresh_token,
-                "grant_type": "refresh_token",
-            },
-            headers={
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            timeout=30,
+    def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
+        return self.dispatch(
+            func=self._send_rendered_email,
+            items=self.template_manager.render_many(
+                template_code=request.template_code,
+                shared_context=request.shared_context,
+                personalized_contexts=request.personalized_context,
+            ),
         )
-        .raise_for_status()
-        .json()["access_token"]
-    )
-    auth_string = f"user={fromaddr}\x01auth=Bearer {access_token}\x01\x01"
-
-    msg = MIMEMultipart(_subtype="related")
-    msg["Subject"] = subject
-    msg["From"] = fromaddr
-    msg["To"] = toaddr
-    msg.preamble = "This is a multi-part message in MIME format."
-    msg_alternative = MIMEMultipart("alternative")
-    msg.attach(msg_alternative)
-    part_text = MIMEText(
-        # TODO: FIXME: use another method instead of lxml.html.fromstring
-        # lxml.html.fromstring(message).text_content().encode("utf-8"), "plain", _charset="utf-8"
-        ""
-    )
-    part_html = MIMEText(message, "html", _charset="utf-8")
-    msg_alternative.attach(part_text)
-    msg_alternative.attach(part_html)
 
-    GmailSMTP(client_id=client_id, auth_string=auth_string, debug=debug).sendmail(fromaddr, [toaddr], msg.as_string())
+
+google_gmail_send_manager = GmailSendManager()
+send_managers = [google_gmail_send_manager]
 
 
 if __name__ == "__main__":
@@ -132,7 +210,7 @@ if __name__ == "__main__":
     response = (
         httpx.post(
             url=f"{GOOGLE_ACCOUNTS_BASE_URL}/o/oauth2/token",
-            content={
+            data={
                 "grant_type": "authorization_code",
                 "code": input("Enter verification code: "),
                 "client_id": client_id,
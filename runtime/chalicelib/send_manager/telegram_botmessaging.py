@@ -5,6 +5,7 @@ import chalicelib.config as config_module
 import chalicelib.external_api.telegram_botmessaging as telegram_client
 import chalicelib.send_manager.__interface__ as sendmgr_interface
 import chalicelib.template_manager.telegram_botmessaging as telegram_template_mgr
+import chalicelib.util.concurrency_util as concurrency_util
 import httpx
 
 logger = logging.getLogger(__name__)
@@ -12,32 +13,38 @@ logger = logging.getLogger(__name__)
 
 class TelegramBotMessagingSender(sendmgr_interface.SendManagerInterface):
     template_manager = telegram_template_mgr.telegram_template_manager
-    send_request_cls: sendmgr_interface.SendRequest
     client = telegram_client.TelegramBotMessagingClient()
+    config = config_module.config.telegram
 
     service_name = "telegram_botmessaging"
     initialized = config_module.config.telegram.is_configured()
 
-    def _send_message(self, chat_id: int | str, render_result: dict[str, str]) -> str:
+    async def _send_message(self, chat_id: int | str, render_result: dict[str, str]) -> str:
         try:
-            return self.client.send_message(
-                payload=(
-                    telegram_template_mgr.SimplifiedTelegramTemplate.model_validate(render_result)
-                    .to_send_message_request_payload(chat_id=chat_id)
-                    .model_dump(mode="json")
-                )
+            result = await self.client.send_message_async(
+                payload=telegram_template_mgr.SimplifiedTelegramTemplate.model_validate(
+                    render_result
+                ).to_send_message_request_payload(chat_id=chat_id)
             )
+            self.record_result(200)
+            return result
         except Exception as e:
-            return e.response.text if isinstance(e, httpx.HTTPStatusError) else "".join(traceback.format_exception(e))
+            self.record_result(sendmgr_interface.get_result_code(e))
+            # Client errors are wrapped by the retry decorator, so unwrap them to get the original HTTP error.
+            cause = e.__cause__ or e
+            if isinstance(cause, httpx.HTTPStatusError):
+                return cause.response.text
+            return "".join(traceback.format_exception(e))
+
+    async def send_async(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
+        return await self.dispatch_async(
+            func=self._send_message,
+            items=self.template_manager.render_many(
+                template_code=request.template_code,
+                shared_context=request.shared_context,
+                personalized_contexts=request.personalized_context,
+            ),
+        )
 
     def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
-        return {
-            chat_id: self._send_message(
-                chat_id=chat_id,
-                render_result=self.template_manager.render(
-                    template_code=request.template_code,
-                    context=request.shared_context | personalized_context,
-                ),
-            )
-            for chat_id, personalized_context in request.personalized_context.items()
-        }
+        return concurrency_util.run_coroutine(self.send_async(request=request))
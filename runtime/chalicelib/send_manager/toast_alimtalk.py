@@ -1,10 +1,21 @@
+import collections
+import itertools
+import typing
+
 import chalicelib.config as config_module
 import chalicelib.external_api.toast_alimtalk as toast_alimtalk_client
 import chalicelib.send_manager.__interface__ as sendmgr_interface
 import chalicelib.template_manager.toast_alimtalk as toast_alimtalk_template_mgr
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.util.type_util as type_util
+import httpx
+
+RecipientsType = tuple[tuple[str, type_util.ContextType], ...]
 
 
-def _send_request_to_toast_request_payload(req: sendmgr_interface.SendRequest) -> toast_alimtalk_client.MsgSendRequest:
+def _send_request_to_toast_request_payload(
+    req: sendmgr_interface.SendRequest, recipients: typing.Iterable[tuple[str, type_util.ContextType]]
+) -> toast_alimtalk_client.MsgSendRequest:
     return toast_alimtalk_client.MsgSendRequest(
         senderKey=config_module.config.toast.sender_key.get_secret_value(),
         templateCode=req.template_code,
@@ -13,22 +24,57 @@ def _send_request_to_toast_request_payload(req: sendmgr_interface.SendRequest) -
                 recipientNo=send_to,
                 templateParameter=personalized_data,
             )
-            for send_to, personalized_data in req.personalized_context.items()
+            for send_to, personalized_data in recipients
         ],
     )
 
 
 class ToastAlimtalkSendManager(sendmgr_interface.SendManagerInterface):
     template_manager = toast_alimtalk_template_mgr.toast_alimtalk_template_manager
-    send_request_cls: sendmgr_interface.SendRequest
     client = toast_alimtalk_client.ToastAlimTalkClient()
+    config = config_module.config.toast
 
     service_name = "toast_alimtalk"
     initialized = config_module.config.toast.is_configured()
 
+    async def send_async(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
+        # Toast API accepts limited number of recipients per request, so recipients are sent in chunks concurrently.
+        # Each chunk is retried on its own, so the successful chunks are not sent again.
+        chunks: dict[str, RecipientsType] = {
+            str(index): recipients
+            for index, recipients in enumerate(
+                itertools.batched(request.personalized_context.items(), self.config.recipient_chunk_size)
+            )
+        }
+        results: dict[str, str] = {}
+
+        async def _send_chunk(chunk_key: str, recipients: RecipientsType) -> str:
+            payload = _send_request_to_toast_request_payload(request, recipients)
+            try:
+                response = await self.client.send_alimtalk_async(payload)
+            except Exception as e:
+                self.record_result(sendmgr_interface.get_result_code(e), len(recipients))
+                # The error is copied to every recipient of the chunk, so keep it short instead of the whole traceback.
+                cause = e.__cause__ or e
+                return f"{e}: {cause.response.text if isinstance(cause, httpx.HTTPStatusError) else repr(cause)}"
+
+            results.update({r.recipientNo: r.resultCode for r in response.message.sendResults})
+            for result_code, count in collections.Counter(r.resultCode for r in response.message.sendResults).items():
+                self.record_result(result_code, count)
+            return response.header.resultMessage
+
+        # Keys are the chunks, not the receivers, so the chunks are not limited by the per-receiver rate limit.
+        chunk_results = await self.dispatch_async(func=_send_chunk, items=chunks.items(), per_key_rate_limit=False)
+
+        # Recipients of the failed or not started chunks get the error of the chunk.
+        for chunk_key, recipients in chunks.items():
+            for recipient_no, _ in recipients:
+                results.setdefault(recipient_no, chunk_results[chunk_key])
+        self.record_deadline_exceeded(results)
+        return results
+
     def send(self, request: sendmgr_interface.SendRequest) -> dict[str, str]:
-        request_payload = _send_request_to_toast_request_payload(request)
-        return {r.recipientNo: r.resultCode for r in self.client.send_alimtalk(request_payload).message.sendResults}
+        return concurrency_util.run_coroutine(self.send_async(request=request))
 
 
 toast_alimtalk_send_manager = ToastAlimtalkSendManager()
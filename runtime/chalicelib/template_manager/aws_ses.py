@@ -1,8 +1,26 @@
+import dataclasses
+import hashlib
+import re
+import typing
+
+import botocore.exceptions
 import chalicelib.aws_resource as aws_resource
+import chalicelib.config as config_module
 import chalicelib.template_manager.__interface__ as template_mgr_interface
+import chalicelib.util.cache_util as cache_util
+import chalicelib.util.jinja_util as jinja_util
+import chalicelib.util.metric_util as metric_util
 import pydantic
 
 
+@dataclasses.dataclass(frozen=True)
+class SESBulkTemplate:
+    # Name of the SES template, or None if the template can't be converted to the SES template.
+    name: str | None
+    variables: frozenset[str]
+    from_: jinja_util.CompiledTemplate
+
+
 class AWSSESTemplateManager(template_mgr_interface.S3ResourceTemplateManager):
     class TemplateStructure(pydantic.BaseModel):
         from_: pydantic.EmailStr
@@ -14,6 +32,68 @@ class AWSSESTemplateManager(template_mgr_interface.S3ResourceTemplateManager):
     template_structure_cls = TemplateStructure
     resource = aws_resource.S3ResourcePath.email_template
 
+    # (template_code, version) -> SES template. SES template is named after its content, so it's synced only once.
+    bulk_template_cache: typing.ClassVar[cache_util.LRUTTLCache[tuple[str, str], SESBulkTemplate]] = (
+        cache_util.LRUTTLCache(
+            max_size=config_module.config.cache.template_max_size,
+            ttl_second=config_module.config.cache.template_ttl_second,
+        )
+    )
+
+    def get_ses_template_name(self, template_code: str, subject_part: str, html_part: str) -> str:
+        # SES template name can only contain alphanumeric characters, underscores and dashes, up to 64 characters.
+        content_hash = hashlib.sha256(f"{subject_part}\0{html_part}".encode(encoding="utf-8")).hexdigest()[:16]
+        prefix = config_module.config.ses.template_name_prefix
+        code = re.sub(r"[^\w-]", "_", template_code, flags=re.ASCII)[: 64 - len(prefix) - len(content_hash) - 1]
+        return f"{prefix}{code}-{content_hash}"
+
+    def sync_ses_template(self, name: str, subject_part: str, html_part: str) -> None:
+        ses_client = aws_resource.get_client("ses")
+        try:
+            ses_client.get_template(TemplateName=name)
+            return
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "TemplateDoesNotExist":
+                raise
+
+        try:
+            ses_client.create_template(
+                Template={"TemplateName": name, "SubjectPart": subject_part, "HtmlPart": html_part}
+            )
+        except botocore.exceptions.ClientError as e:
+            # Created by the other container at the same time.
+            if e.response.get("Error", {}).get("Code") != "AlreadyExists":
+                raise
+
+    def _build_bulk_template(self, template_info: template_mgr_interface.TemplateInformation) -> SESBulkTemplate:
+        delims = self.template_variable_start_end_string
+        template = self.template_structure_cls.model_validate(template_info.template)
+        subject_part = jinja_util.to_handlebars_template(template.title, delims)
+        html_part = jinja_util.to_handlebars_template(template.body, delims)
+
+        name: str | None = None
+        if subject_part is not None and html_part is not None:
+            name = self.get_ses_template_name(template_info.template_code, subject_part, html_part)
+            self.sync_ses_template(name=name, subject_part=subject_part, html_part=html_part)
+
+        variables = jinja_util.get_template_variables(template.title, delims)
+        variables |= jinja_util.get_template_variables(template.body, delims)
+        return SESBulkTemplate(
+            name=name,
+            variables=frozenset(variables),
+            from_=jinja_util.compile_template(template_str=template.from_, template_variable_start_end_string=delims),
+        )
+
+    def get_bulk_template(self, template_code: str) -> SESBulkTemplate | None:
+        if not (template_info := self.retrieve(template_code=template_code)):
+            return None
+
+        return self.bulk_template_cache.get_or_set(
+            key=(template_code, template_info.version or ""),
+            factory=lambda: self._build_bulk_template(template_info=template_info),
+        )
+
 
 aws_ses_template_manager = AWSSESTemplateManager()
+metric_util.metrics.track_cache("ses_bulk_template", AWSSESTemplateManager.bulk_template_cache.stats)
 template_managers = [aws_ses_template_manager]
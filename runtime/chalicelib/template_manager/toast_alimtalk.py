@@ -1,11 +1,149 @@
 from __future__ import annotations
 
+import contextlib
+import json
+import logging
+import pathlib
+import threading
+import time
 import typing
 
 import chalicelib.config as config_module
 import chalicelib.external_api.toast_alimtalk as toast_alimtalk_client
 import chalicelib.template_manager.__interface__ as template_mgr_interface
 
+logger = logging.getLogger(__name__)
+
+
+class ToastAlimtalkTemplateCatalog:
+    """
+    Local copy of the Toast template catalog, keyed by `templateCode`.
+    The catalog is refreshed once per TTL by a single caller, and is kept as a snapshot file to survive cold starts.
+    """
+
+    def __init__(
+        self,
+        client: toast_alimtalk_client.ToastAlimTalkClient,
+        ttl_second: float,
+        miss_ttl_second: float = 30,
+        snapshot_path: str | None = None,
+    ) -> None:
+        self.client = client
+        self.ttl_second = ttl_second
+        self.miss_ttl_second = miss_ttl_second
+        self.snapshot_path = pathlib.Path(snapshot_path) if snapshot_path else None
+        self.templates: dict[str, toast_alimtalk_client.Template] = {}
+        self.refreshed_at: float | None = None  # time.time() based, as it's also stored on the snapshot.
+        # Template code -> time.monotonic() until when the code is known to be missing.
+        self.missing_until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.refreshed_at is not None and time.time() - self.refreshed_at < self.ttl_second
+
+    def fetch_all(self) -> list[toast_alimtalk_client.Template]:
+        templates: list[toast_alimtalk_client.Template] = []
+        query_params = toast_alimtalk_client.TemplateListQueryRequest(pageNum=1)
+        while True:
+            page = self.client.get_template_list(query_params=query_params).templateListResponse
+            templates.extend(page.templates)
+            if not page.templates or len(templates) >= page.totalCount:
+                return templates
+            query_params = query_params.model_copy(update={"pageNum": query_params.pageNum + 1})
+
+    def merge(self, templates: typing.Iterable[toast_alimtalk_client.Template]) -> None:
+        # Toast API can't filter the templates by the update date, so the whole catalog is fetched,
+        # but only the updated templates are replaced to keep their compiled templates in the cache.
+        merged: dict[str, toast_alimtalk_client.Template] = {}
+        for template in templates:
+            if (current := self.templates.get(template.templateCode)) and current.updateDate >= template.updateDate:
+                template = current
+            merged[template.templateCode] = template
+        self.templates = merged
+
+    def load_snapshot(self) -> None:
+        if not (self.snapshot_path and self.snapshot_path.is_file()):
+            return
+
+        with contextlib.suppress(Exception):
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            self.merge(toast_alimtalk_client.Template.model_validate(t) for t in snapshot["templates"])
+            self.refreshed_at = float(snapshot["refreshed_at"])
+
+    def save_snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+
+        try:
+            # Write on the temporary file and rename it, so that the other processes don't read the partial file.
+            tmp_path = self.snapshot_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_text(
+                json.dumps(
+                    {
+                        "refreshed_at": self.refreshed_at,
+                        "templates": [t.model_dump(mode="json") for t in self.templates.values()],
+                    },
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+            tmp_path.replace(self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Failed to save the Toast template snapshot: {e}")
+
+    def refresh(self, force: bool = False) -> None:
+        if not force and self.is_fresh:
+            return
+
+        # Only one caller refreshes the catalog, and the others wait for it and use its result.
+        with self._lock:
+            if self.refreshed_at is None:
+                self.load_snapshot()
+            if not force and self.is_fresh:
+                return
+
+            try:
+                self.merge(self.fetch_all())
+                # Missing templates are looked up again after the refresh, and this also bounds the size of the map.
+                self.missing_until = {}
+            except Exception as e:
+                if self.refreshed_at is None:
+                    raise
+                # Serve the stale catalog instead of failing every lookup, and try again after the TTL.
+                logger.warning(f"Failed to refresh the Toast template catalog, using the stale one: {e}")
+
+            self.refreshed_at = time.time()
+            self.save_snapshot()
+
+    def list(self) -> list[toast_alimtalk_client.Template]:
+        self.refresh()
+        return list(self.templates.values())
+
+    def get(self, template_code: str) -> toast_alimtalk_client.Template | None:
+        self.refresh()
+        if template := self.templates.get(template_code):
+            return template
+
+        if time.monotonic() < self.missing_until.get(template_code, 0):
+            return None
+
+        # The template might be created after the last refresh.
+        # Only one caller looks it up, and the others wait for it and use its result.
+        with self._lock:
+            if template := self.templates.get(template_code):
+                return template
+            if time.monotonic() < self.missing_until.get(template_code, 0):
+                return None
+
+            query_params = toast_alimtalk_client.TemplateListQueryRequest(templateCode=template_code)
+            if templates := self.client.get_template_list(query_params=query_params).templateListResponse.templates:
+                self.merge([*self.templates.values(), templates[0]])
+                return templates[0]
+
+            self.missing_until[template_code] = time.monotonic() + self.miss_ttl_second
+            return None
+
 
 class ToastAlimtalkTemplateManager(template_mgr_interface.TemplateManagerInterface):
     service_name = "toast_alimtalk"
@@ -14,30 +152,33 @@ class ToastAlimtalkTemplateManager(template_mgr_interface.TemplateManagerInterfa
     template_variable_start_end_string: typing.ClassVar[tuple[str, str]] = ("#{", "}")
 
     client: typing.ClassVar[toast_alimtalk_client.ToastAlimTalkClient] = toast_alimtalk_client.ToastAlimTalkClient()
+    catalog: typing.ClassVar[ToastAlimtalkTemplateCatalog] = ToastAlimtalkTemplateCatalog(
+        client=client,
+        ttl_second=config_module.config.cache.toast_template_ttl_second,
+        miss_ttl_second=config_module.config.cache.toast_template_miss_ttl_second,
+        snapshot_path=config_module.config.cache.toast_template_snapshot_path,
+    )
 
     @property
     def initialized(self) -> bool:
         return config_module.config.toast.is_configured()
 
+    def _to_template_information(
+        self, template: toast_alimtalk_client.Template
+    ) -> template_mgr_interface.TemplateInformation:
+        return template_mgr_interface.TemplateInformation(
+            template_code=template.templateCode,
+            template=template.model_dump(mode="json"),
+            template_variable_start_end_string=self.template_variable_start_end_string,
+            version=template.updateDate.isoformat(),
+        )
+
     def list(self) -> list[template_mgr_interface.TemplateInformation]:
-        return [
-            template_mgr_interface.TemplateInformation(
-                template_code=t.templateCode,
-                template=t.model_dump(mode="json"),
-                template_variable_start_end_string=self.template_variable_start_end_string,
-            )
-            for t in self.client.get_template_list().templateListResponse.templates
-            if t.status == "TSC03"
-        ]
+        return [self._to_template_information(t) for t in self.catalog.list() if t.status == "TSC03"]
 
     def retrieve(self, template_code: str) -> template_mgr_interface.TemplateInformation | None:
-        query_params = toast_alimtalk_client.TemplateListQueryRequest(templateCode=template_code)
-        if t := self.client.get_template_list(query_params=query_params).templateListResponse.templates:
-            return template_mgr_interface.TemplateInformation(
-                template_code=t[0].templateCode,
-                template=t[0].model_dump(mode="json"),
-                template_variable_start_end_string=self.template_variable_start_end_string,
-            )
+        if template := self.catalog.get(template_code):
+            return self._to_template_information(template)
         return None
 
     def create(self, template_code: str, template_data: str) -> template_mgr_interface.TemplateInformation:
@@ -0,0 +1,74 @@
+import collections
+import dataclasses
+import threading
+import time
+import typing
+
+KeyType = typing.TypeVar("KeyType", bound=typing.Hashable)
+ValueType = typing.TypeVar("ValueType")
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / total if (total := self.hits + self.misses) else 0.0
+
+    def to_dict(self) -> dict[str, int | float]:
+        return dataclasses.asdict(self) | {"hit_rate": self.hit_rate}
+
+
+class LRUTTLCache(typing.Generic[KeyType, ValueType]):
+    def __init__(self, max_size: int, ttl_second: float | None = None) -> None:
+        self.max_size = max_size
+        self.ttl_second = ttl_second
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[KeyType, tuple[float, ValueType]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: KeyType) -> bool:
+        return self.get(key, count=False) is not None
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl_second is not None and time.monotonic() - stored_at > self.ttl_second
+
+    def get(self, key: KeyType, *, count: bool = True) -> ValueType | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) and not self._is_expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.stats.hits += count
+                return entry[1]
+
+            if entry:
+                del self._entries[key]
+                self.stats.evictions += 1
+            self.stats.misses += count
+            return None
+
+    def set(self, key: KeyType, value: ValueType) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def get_or_set(self, key: KeyType, factory: typing.Callable[[], ValueType]) -> ValueType:
+        if (value := self.get(key)) is None:
+            self.set(key, value := factory())
+        return value
+
+    def pop(self, key: KeyType) -> ValueType | None:
+        with self._lock:
+            return entry[1] if (entry := self._entries.pop(key, None)) else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
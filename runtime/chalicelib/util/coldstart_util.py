@@ -0,0 +1,134 @@
+"""
+Measures where the cold start time goes. Import this module before any other module to time their imports.
+The report is logged once per container, after the first invocation.
+"""
+
+import contextlib
+import dataclasses
+import importlib.machinery
+import json
+import logging
+import sys
+import threading
+import time
+import types
+import typing
+
+logger = logging.getLogger(__name__)
+
+TIMED_LOADER_TYPES = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+
+@dataclasses.dataclass
+class ImportRecord:
+    name: str
+    cumulative_second: float
+    self_second: float
+    # Imported while no other module was being imported, e.g. the imports on app.py or the lazy imports.
+    is_top_level: bool
+
+
+class ColdStartProfiler:
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.initialized_at: float | None = None
+        self.imports: dict[str, ImportRecord] = {}
+        self.steps: dict[str, float] = {}
+        self.reported = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self) -> list[float]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def install(self) -> None:
+        # Placed right before the PathFinder, so that the other custom finders still take precedence.
+        if self not in sys.meta_path:
+            sys.meta_path.insert(sys.meta_path.index(importlib.machinery.PathFinder), self)
+
+    def uninstall(self) -> None:
+        with contextlib.suppress(ValueError):
+            sys.meta_path.remove(self)
+
+    def find_spec(
+        self, fullname: str, path: typing.Sequence[str] | None, target: types.ModuleType | None = None
+    ) -> importlib.machinery.ModuleSpec | None:
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec and isinstance(spec.loader, TIMED_LOADER_TYPES):
+            spec.loader.exec_module = self._timed(fullname, spec.loader.exec_module)  # type: ignore[assignment]
+        return spec
+
+    def _timed(
+        self, name: str, exec_module: typing.Callable[[types.ModuleType], None]
+    ) -> typing.Callable[[types.ModuleType], None]:
+        def wrapper(module: types.ModuleType) -> None:
+            stack = self._stack
+            stack.append(0.0)  # Time spent on importing the children of this module
+            started_at = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - started_at
+                children_elapsed = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.imports[name] = ImportRecord(
+                    name=name,
+                    cumulative_second=elapsed,
+                    self_second=elapsed - children_elapsed,
+                    is_top_level=not stack,
+                )
+
+        return wrapper
+
+    @contextlib.contextmanager
+    def measure(self, step: str) -> typing.Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[step] = self.steps.get(step, 0.0) + time.perf_counter() - started_at
+
+    def mark_initialized(self) -> None:
+        self.initialized_at = time.perf_counter()
+
+    def get_report(self, top_n: int = 20) -> dict[str, typing.Any]:
+        records = list(self.imports.values())
+        packages: dict[str, float] = {}
+        for record in records:
+            package = record.name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + record.self_second
+
+        def _top(items: typing.Iterable[tuple[str, float]]) -> dict[str, float]:
+            return {k: round(v * 1000, 2) for k, v in sorted(items, key=lambda kv: kv[1], reverse=True)[:top_n]}
+
+        return {
+            "init_ms": round(((self.initialized_at or time.perf_counter()) - self.started_at) * 1000, 2),
+            "import_ms": round(sum(r.cumulative_second for r in records if r.is_top_level) * 1000, 2),
+            "module_count": len(records),
+            "steps_ms": _top(self.steps.items()),
+            "packages_self_ms": _top(packages.items()),
+            "modules_cumulative_ms": _top((r.name, r.cumulative_second) for r in records),
+            "modules_self_ms": _top((r.name, r.self_second) for r in records),
+        }
+
+    def emit_once(self, log: logging.Logger = logger, top_n: int = 20) -> None:
+        with self._lock:
+            if self.reported:
+                return
+            self.reported = True
+
+        # Imports after the first invocation are not interesting anymore, so stop timing them.
+        self.uninstall()
+        log.info(f"COLDSTART {json.dumps(self.get_report(top_n=top_n))}")
+
+
+profiler = ColdStartProfiler()
+profiler.install()
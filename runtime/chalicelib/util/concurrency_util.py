@@ -0,0 +1,166 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import math
+import threading
+import time
+import traceback
+import typing
+
+KeyType = typing.TypeVar("KeyType", bound=typing.Hashable)
+ArgType = typing.TypeVar("ArgType")
+RetType = typing.TypeVar("RetType")
+
+DEADLINE_EXCEEDED_RESULT = "Not sent: dispatch deadline exceeded"
+
+# time.monotonic() based timestamp until when the current invocation must finish its job.
+# It's anchored once when the invocation starts, so that the remaining time runs down during the invocation.
+deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+event_loop_lock = threading.Lock()
+event_loop: asyncio.AbstractEventLoop | None = None
+
+
+@contextlib.contextmanager
+def deadline_scope(remaining_second: float) -> typing.Iterator[None]:
+    token = deadline.set(time.monotonic() + remaining_second)
+    try:
+        yield
+    finally:
+        deadline.reset(token)
+
+
+def get_deadline() -> float:
+    # Entry points (the SQS worker and the send API) open the deadline scope, and there's no deadline without it.
+    return current_deadline if (current_deadline := deadline.get()) is not None else math.inf
+
+
+def get_remaining_second() -> float:
+    return max(get_deadline() - time.monotonic(), 0.0)
+
+
+def _format_exception(e: BaseException) -> str:
+    return "".join(traceback.format_exception(e))
+
+
+def dispatch_threaded(
+    func: typing.Callable[[KeyType, ArgType], str],
+    items: typing.Iterable[tuple[KeyType, ArgType]],
+    max_concurrency: int,
+) -> dict[KeyType, str]:
+    """
+    Calls `func(key, arg)` for each item with at most `max_concurrency` calls in flight.
+    Items are not started after the deadline, but calls already in flight are waited for.
+    """
+    end_at = get_deadline()
+    results: dict[KeyType, str] = {}
+    pending: dict[concurrent.futures.Future[str], KeyType] = {}
+
+    def _collect(futures: typing.Iterable[concurrent.futures.Future[str]]) -> None:
+        for future in futures:
+            key = pending.pop(future)
+            results[key] = _format_exception(exc) if (exc := future.exception()) else future.result()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for key, arg in items:
+            if time.monotonic() >= end_at:
+                results[key] = DEADLINE_EXCEEDED_RESULT
+                continue
+
+            if len(pending) >= max_concurrency:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                _collect(done)
+
+            # Keep the order of the results same as the order of the items.
+            results[key] = DEADLINE_EXCEEDED_RESULT
+            pending[executor.submit(contextvars.copy_context().run, func, key, arg)] = key
+
+        _collect(concurrent.futures.wait(pending).done)
+
+    return results
+
+
+def map_threaded(
+    func: typing.Callable[[ArgType], RetType],
+    items: typing.Iterable[ArgType],
+    max_concurrency: int,
+) -> list[RetType]:
+    """Works like `map(func, items)`, but calls `func` concurrently on threads. Exceptions are re-raised."""
+    if len(items := list(items)) <= 1 or max_concurrency <= 1:
+        return [func(item) for item in items]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(items), max_concurrency)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+async def dispatch_async(
+    func: typing.Callable[[KeyType, ArgType], typing.Awaitable[str]],
+    items: typing.Iterable[tuple[KeyType, ArgType]],
+    max_concurrency: int,
+) -> dict[KeyType, str]:
+    """Same as `dispatch_threaded`, but runs `func` as coroutines on the running event loop."""
+    end_at = get_deadline()
+    results: dict[KeyType, str] = {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks: list[asyncio.Task[None]] = []
+
+    async def _run(key: KeyType, arg: ArgType) -> None:
+        try:
+            results[key] = await func(key, arg)
+        except Exception as e:
+            results[key] = _format_exception(e)
+        finally:
+            semaphore.release()
+
+    for key, arg in items:
+        await semaphore.acquire()
+        if time.monotonic() >= end_at:
+            semaphore.release()
+            results[key] = DEADLINE_EXCEEDED_RESULT
+            continue
+
+        results[key] = DEADLINE_EXCEEDED_RESULT
+        tasks.append(asyncio.create_task(_run(key, arg)))
+
+    await asyncio.gather(*tasks)
+    return results
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop running forever on a background thread.
+    The loop lives as long as the Lambda container, so async sessions bound to it keep their connections alive.
+    """
+    global event_loop
+
+    if not event_loop:
+        with event_loop_lock:
+            if not event_loop:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="notico-event-loop", daemon=True).start()
+                event_loop = loop
+    return event_loop
+
+
+def run_coroutine(coro: typing.Coroutine[typing.Any, typing.Any, RetType]) -> RetType:
+    """
+    Runs the coroutine on the shared event loop, and waits for its result.
+    Every coroutine runs on the same loop, so the async sessions bound to the loop are reused and never leaked.
+    """
+    try:
+        running_loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is (loop := get_event_loop()):
+        coro.close()
+        raise RuntimeError("Blocking the shared event loop on itself is a deadlock, await the coroutine instead.")
+
+    # Runs the coroutine with the context of the caller, as the deadline is kept in the context variable.
+    context = contextvars.copy_context()
+
+    async def _run_with_context() -> RetType:
+        return await asyncio.get_running_loop().create_task(coro, context=context)
+
+    return asyncio.run_coroutine_threadsafe(_run_with_context(), loop).result()
@@ -1,25 +1,180 @@
+import asyncio
+import contextlib
+import dataclasses
+import email.utils
 import functools
+import random
+import threading
+import time
 import typing
 
+import botocore.exceptions
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.util.metric_util as metric_util
+import httpx
+
 Param = typing.ParamSpec("Param")
 RetType = typing.TypeVar("RetType")
 
+RETRYABLE_HTTP_STATUS_CODES = frozenset({408, 425, 429})
+RETRYABLE_AWS_ERROR_CODES = frozenset(
+    {
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "RequestThrottled",
+        "TooManyRequestsException",
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "SlowDown",
+        "RequestTimeout",
+        "RequestTimeoutException",
+        "ServiceUnavailable",
+        "InternalError",
+    }
+)
+
 
 class RetriesFailedException(Exception):
     pass
 
 
+@dataclasses.dataclass(frozen=True)
+class RetryDecision:
+    retryable: bool
+    retry_after: float | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    retry_count: int = 3
+    base_delay_second: float = 0.2
+    max_delay_second: float = 5.0
+    # Total time budget for all attempts. It's also limited by the remaining time of the invocation.
+    budget_second: float = 30.0
+
+    def get_delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay_second, self.base_delay_second * 2**attempt))  # nosec: B311
+
+
+@dataclasses.dataclass
+class RetryStats:
+    retries: int = 0
+    give_ups: int = 0
+    sleep_second: float = 0.0
+    _lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False)
+
+    def record(self, sleep_second: float | None) -> None:
+        with self._lock:
+            if sleep_second is None:
+                self.give_ups += 1
+            else:
+                self.retries += 1
+                self.sleep_second += sleep_second
+
+    def to_dict(self) -> dict[str, int | float]:
+        return {"retries": self.retries, "give_ups": self.give_ups, "sleep_second": self.sleep_second}
+
+
+retry_stats = RetryStats()
+
+
+def _parse_retry_after_header(value: str | None) -> float | None:
+    if not value:
+        return None
+    with contextlib.suppress(ValueError):
+        return max(float(value), 0.0)
+    with contextlib.suppress(TypeError, ValueError):
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    return None
+
+
+def _parse_retry_after_body(response: httpx.Response) -> float | None:
+    # Telegram tells us when to retry in the response body, like `{"parameters": {"retry_after": 3}}`.
+    with contextlib.suppress(Exception):
+        if (retry_after := response.json().get("parameters", {}).get("retry_after")) is not None:
+            return float(retry_after)
+    return None
+
+
+def classify_exception(exc: BaseException) -> RetryDecision:
+    if isinstance(exc, httpx.HTTPStatusError):
+        response = exc.response
+        if not (response.status_code in RETRYABLE_HTTP_STATUS_CODES or response.status_code >= 500):
+            return RetryDecision(retryable=False)
+
+        retry_after = _parse_retry_after_header(response.headers.get("Retry-After"))
+        return RetryDecision(retryable=True, retry_after=retry_after or _parse_retry_after_body(response))
+
+    if isinstance(exc, botocore.exceptions.ClientError):
+        error_code = exc.response.get("Error", {}).get("Code", "")
+        status_code = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return RetryDecision(retryable=error_code in RETRYABLE_AWS_ERROR_CODES or status_code >= 500)
+
+    # Timeouts and network errors
+    retryable_exceptions = (httpx.TransportError, botocore.exceptions.HTTPClientError, TimeoutError, OSError)
+    return RetryDecision(retryable=isinstance(exc, retryable_exceptions))
+
+
+def get_retry_delay(
+    policy: RetryPolicy, attempt: int, exc: Exception, started_at: float, operation: str
+) -> float | None:
+    """Returns seconds to sleep before the next attempt, or None if we should not retry anymore."""
+    decision = classify_exception(exc)
+    delay: float | None = None
+    if decision.retryable and attempt + 1 < policy.retry_count:
+        delay = policy.get_delay(attempt=attempt, retry_after=decision.retry_after)
+        remaining_second = policy.budget_second - (time.monotonic() - started_at)
+        if delay > min(remaining_second, concurrency_util.get_remaining_second()):
+            delay = None
+
+    retry_stats.record(sleep_second=delay)
+    metric_util.metrics.increment("RetryCount" if delay is not None else "RetryGiveUpCount", Operation=operation)
+    return delay
+
+
+def _get_retry_options(args: tuple, kwargs: dict) -> tuple[RetryPolicy, type[Exception]]:
+    self = args[0] if args else kwargs["self"]
+    policy: RetryPolicy = getattr(self, "retry_policy", None) or RetryPolicy()
+    if retry_count := getattr(self, "retry_count", None):
+        policy = dataclasses.replace(policy, retry_count=retry_count)
+    return policy, getattr(self, "exc_cls", RetriesFailedException)
+
+
 def retry(func: typing.Callable[Param, RetType]) -> typing.Callable[Param, RetType]:
     @functools.wraps(wrapped=func)
     def wrapper(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
-        retry_count: int = getattr(args[0] if args else kwargs["self"], "retry_count", 3)
-        ExceptionClass: type = getattr(args[0] if args else kwargs["self"], "exc_cls", RetriesFailedException)
-        exc: Exception | None = None
-        for _ in range(retry_count):
+        policy, ExceptionClass = _get_retry_options(args, kwargs)
+        started_at = time.monotonic()
+        for attempt in range(policy.retry_count):
             try:
                 return func(*args, **kwargs)
             except Exception as e:
-                exc = e
-        raise ExceptionClass(f"Failed after {retry_count} times") from exc
+                if (delay := get_retry_delay(policy, attempt, e, started_at, func.__qualname__)) is None:
+                    raise ExceptionClass(f"Failed after {attempt + 1} times") from e
+                time.sleep(delay)
+        raise ExceptionClass(f"Failed after {policy.retry_count} times")
+
+    return wrapper
+
+
+def retry_async(
+    func: typing.Callable[Param, typing.Awaitable[RetType]],
+) -> typing.Callable[Param, typing.Awaitable[RetType]]:
+    @functools.wraps(wrapped=func)
+    async def wrapper(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
+        policy, ExceptionClass = _get_retry_options(args, kwargs)
+        started_at = time.monotonic()
+        for attempt in range(policy.retry_count):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if (delay := get_retry_delay(policy, attempt, e, started_at, func.__qualname__)) is None:
+                    raise ExceptionClass(f"Failed after {attempt + 1} times") from e
+                await asyncio.sleep(delay)
+        raise ExceptionClass(f"Failed after {policy.retry_count} times")
 
     return wrapper
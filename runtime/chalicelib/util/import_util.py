@@ -1,11 +1,20 @@
+import collections.abc
 import contextlib
-import importlib.util
+import importlib
+import json
 import pathlib
+import threading
 import types
 import typing
 
 T = typing.TypeVar("T")
 
+CHALICELIB_DIR = pathlib.Path(__file__).parent.parent
+# Generated on the image build by `python -m chalicelib.util.import_util`. See `build_manifest`.
+MANIFEST_PATH = CHALICELIB_DIR / "plugin_manifest.json"
+# pattern -> {plugin name -> dotted module path}
+ManifestType = dict[str, dict[str, str]]
+
 
 def isiterable(a: typing.Any) -> bool:
     with contextlib.suppress(TypeError):
@@ -13,28 +22,120 @@ def isiterable(a: typing.Any) -> bool:
     return False
 
 
+def get_module_name(module_path: pathlib.Path) -> str:
+    # Import modules by their dotted path, so that the module is not loaded twice under different names.
+    return ".".join(module_path.resolve().relative_to(CHALICELIB_DIR.parent).with_suffix("").parts)
+
+
+def find_modules(file_prefix: str, dir: pathlib.Path) -> list[str]:
+    return sorted(
+        get_module_name(module_path)
+        for module_path in dir.glob(f"**/{file_prefix}*.py")
+        if not module_path.stem.startswith("__")
+    )
+
+
 def load_module(module_path: pathlib.Path) -> types.ModuleType:
     if not module_path.is_file():
         raise ValueError(f"module_path must be file path: {module_path}")
+    return importlib.import_module(get_module_name(module_path))
+
 
-    module_path = module_path.resolve()
-    module_name = module_path.stem
-    module_spec = importlib.util.spec_from_file_location(module_name, module_path)
-    module = importlib.util.module_from_spec(module_spec)
-    module_spec.loader.exec_module(module)
-    return module
+def get_module_objs(module: types.ModuleType, pattern: str) -> list[typing.Any]:
+    return list(objs) if isiterable(objs := getattr(module, pattern, None)) else []
 
 
 def auto_import_objs(pattern: str, file_prefix: str, dir: pathlib.Path) -> list[T]:
     collected_objs: list[T] = []
-    for module_path in dir.glob(f"**/{file_prefix}*.py"):
-        if module_path.stem.startswith("__"):
-            continue
-
-        if obj := typing.cast(T, getattr(load_module(module_path), pattern, None)):
+    for module_name in find_modules(file_prefix=file_prefix, dir=dir):
+        if obj := typing.cast(T, getattr(importlib.import_module(module_name), pattern, None)):
             collected_objs.append(obj)
     return collected_objs
 
 
 def auto_import_patterns(pattern: str, file_prefix: str, dir: pathlib.Path) -> list[T]:
     return list(filter(isiterable, auto_import_objs(pattern, file_prefix, dir)))
+
+
+def load_manifest() -> ManifestType | None:
+    with contextlib.suppress(OSError, ValueError):
+        return typing.cast(ManifestType, json.loads(MANIFEST_PATH.read_text(encoding="utf-8")))
+    return None
+
+
+class LazyRegistry(collections.abc.Mapping[str, T]):
+    """
+    Mapping of the plugins, which imports the module of a plugin when it's accessed first.
+    Plugin names are read from the manifest. Without the manifest, every module is imported on the first access.
+    """
+
+    def __init__(self, pattern: str, dir: pathlib.Path, get_name: typing.Callable[[T], str]) -> None:
+        self.pattern = pattern
+        self.dir = dir
+        self.get_name = get_name
+        self._lock = threading.RLock()
+        self._plugins: dict[str, T] = {}
+        self._plugin_modules: dict[str, str] = {}
+        self._loaded_modules: set[str] = set()
+        manifest = load_manifest()
+        self._manifest: dict[str, str] | None = manifest.get(pattern) if manifest else None
+
+    def _load_module(self, module_name: str) -> None:
+        with self._lock:
+            if module_name in self._loaded_modules:
+                return
+
+            for plugin in get_module_objs(importlib.import_module(module_name), self.pattern):
+                if (name := self.get_name(plugin)) in self._plugins and self._plugins[name] is not plugin:
+                    raise ValueError(f"{self.pattern} {name} is already registered")
+                self._plugins[name], self._plugin_modules[name] = plugin, module_name
+            self._loaded_modules.add(module_name)
+
+    def load_all(self) -> dict[str, T]:
+        module_names = find_modules("", self.dir) if self._manifest is None else set(self._manifest.values())
+        for module_name in sorted(module_names):
+            self._load_module(module_name)
+        return self._plugins
+
+    def scan(self) -> dict[str, str]:
+        """Imports every module on the directory regardless of the manifest, and returns the plugin name -> module."""
+        for module_name in find_modules(file_prefix="", dir=self.dir):
+            self._load_module(module_name)
+        return dict(self._plugin_modules)
+
+    def __getitem__(self, name: str) -> T:
+        if self._manifest is None:
+            return self.load_all()[name]
+
+        if name not in self._plugins and (module_name := self._manifest.get(name)):
+            self._load_module(module_name)
+        return self._plugins[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._manifest if self._manifest is not None else name in self.load_all()
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(list(self._manifest) if self._manifest is not None else list(self.load_all()))
+
+    def __len__(self) -> int:
+        return len(self._manifest) if self._manifest is not None else len(self.load_all())
+
+
+# Packages which have the plugin registry, and the attribute name of the registry.
+REGISTRY_PACKAGES: dict[str, str] = {
+    "chalicelib.send_manager": "send_managers",
+    "chalicelib.template_manager": "template_managers",
+    "chalicelib.worker": "workers",
+}
+
+
+def build_manifest() -> ManifestType:
+    return {
+        pattern: typing.cast(LazyRegistry, getattr(importlib.import_module(package), pattern)).scan()
+        for package, pattern in REGISTRY_PACKAGES.items()
+    }
+
+
+if __name__ == "__main__":
+    MANIFEST_PATH.write_text(json.dumps(build_manifest(), indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Plugin manifest is written on {MANIFEST_PATH}")
@@ -1,14 +1,103 @@
+import dataclasses
+import functools
+import json
+import re
+import typing
+
 import jinja2
 import jinja2.meta
 import jinja2.nodes
 
 
+@dataclasses.dataclass(frozen=True)
+class CompiledTemplate:
+    variables: frozenset[str]
+    template: jinja2.Template
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledJSONTemplate:
+    variables: frozenset[str]
+    # One compiled template per top-level field, so that each field can be rendered independently.
+    parts: tuple[CompiledTemplate, ...]
+
+    @staticmethod
+    def render_part(part: CompiledTemplate, context: dict[str, typing.Any]) -> dict[str, typing.Any]:
+        return json.loads(s=part.template.render(context))
+
+    def render(self, context: dict[str, typing.Any]) -> dict[str, typing.Any]:
+        result: dict[str, typing.Any] = {}
+        for part in self.parts:
+            result.update(self.render_part(part=part, context=context))
+        return result
+
+
+@functools.cache
+def get_environment(template_variable_start_end_string: tuple[str, str]) -> jinja2.Environment:
+    # Same options as `jinja2.Template(source=...)`, so compiled templates render exactly like before.
+    return jinja2.Environment(
+        variable_start_string=template_variable_start_end_string[0],
+        variable_end_string=template_variable_start_end_string[1],
+    )
+
+
 def get_template_variables(template_str: str, template_variable_start_end_string: tuple[str, str]) -> set[str]:
     # From https://stackoverflow.com/a/77363330
     return jinja2.meta.find_undeclared_variables(
-        ast=jinja2.Environment(
-            autoescape=True,
-            variable_start_string=template_variable_start_end_string[0],
-            variable_end_string=template_variable_start_end_string[1],
-        ).parse(source=template_str)
+        ast=get_environment(template_variable_start_end_string).parse(source=template_str)
     )
+
+
+def compile_template(template_str: str, template_variable_start_end_string: tuple[str, str]) -> CompiledTemplate:
+    # Parse only once, and reuse the AST for both variable lookup and compilation.
+    environment = get_environment(template_variable_start_end_string)
+    ast = environment.parse(source=template_str)
+    return CompiledTemplate(
+        variables=frozenset(jinja2.meta.find_undeclared_variables(ast=ast)),
+        template=environment.from_string(source=ast),
+    )
+
+
+def compile_json_template(
+    template: dict[str, typing.Any],
+    template_variable_start_end_string: tuple[str, str],
+) -> CompiledJSONTemplate:
+    try:
+        parts = tuple(
+            compile_template(
+                template_str=json.dumps({key: value}, ensure_ascii=False),
+                template_variable_start_end_string=template_variable_start_end_string,
+            )
+            for key, value in template.items()
+        )
+    except jinja2.TemplateSyntaxError:
+        # A block tag spans over multiple fields, so this template can only be rendered as a whole.
+        parts = (
+            compile_template(
+                template_str=json.dumps(template, ensure_ascii=False),
+                template_variable_start_end_string=template_variable_start_end_string,
+            ),
+        )
+
+    return CompiledJSONTemplate(variables=frozenset().union(*(p.variables for p in parts)), parts=parts)
+
+
+def to_handlebars_template(template_str: str, template_variable_start_end_string: tuple[str, str]) -> str | None:
+    """
+    Converts the template which only substitutes variables into the Handlebars template, which is used by AWS SES.
+    Returns None if the template uses any other Jinja feature, like filters, conditions or loops.
+    """
+    converted: list[str] = []
+    for node in get_environment(template_variable_start_end_string).parse(source=template_str).body:
+        if not isinstance(node, jinja2.nodes.Output):
+            return None
+
+        for child in node.nodes:
+            if isinstance(child, jinja2.nodes.TemplateData) and not re.search(r"{{|}}", child.data):
+                converted.append(child.data)
+            elif isinstance(child, jinja2.nodes.Name) and re.fullmatch(r"[A-Za-z_]\w*", child.name):
+                # Triple braces, as Jinja environment here doesn't escape the values either.
+                converted.append(f"{{{{{{{child.name}}}}}}}")
+            else:
+                return None
+    return "".join(converted)
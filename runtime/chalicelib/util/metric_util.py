@@ -0,0 +1,188 @@
+"""
+Aggregates metrics in the process, and writes them as CloudWatch Embedded Metric Format (EMF) logs on flush.
+CloudWatch extracts the metrics from the logs, so no API call is made to put the metrics.
+See https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+"""
+
+import contextlib
+import dataclasses
+import json
+import random
+import sys
+import threading
+import time
+import typing
+
+import chalicelib.config as config_module
+
+MetricUnitType = typing.Literal["Count", "Milliseconds", "Percent"]
+# Sorted (dimension name, dimension value) pairs.
+DimensionsType = tuple[tuple[str, str], ...]
+EMFDocumentType = dict[str, typing.Any]
+
+# EMF allows up to 100 values per metric in a document.
+EMF_MAX_VALUES_PER_METRIC = 100
+
+
+class CacheStatsType(typing.Protocol):
+    hits: int
+    misses: int
+
+
+class MetricSink(typing.Protocol):
+    def write(self, document: EMFDocumentType) -> None: ...
+
+
+class StdoutMetricSink:
+    def write(self, document: EMFDocumentType) -> None:
+        sys.stdout.write(json.dumps(document, separators=(",", ":"), ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+class MemoryMetricSink:
+    """Keeps the documents in memory, to check the metrics without CloudWatch."""
+
+    def __init__(self) -> None:
+        self.documents: list[EMFDocumentType] = []
+
+    def write(self, document: EMFDocumentType) -> None:
+        self.documents.append(document)
+
+
+@dataclasses.dataclass
+class Histogram:
+    unit: MetricUnitType
+    max_samples: int
+    samples: list[float] = dataclasses.field(default_factory=list)
+    count: int = 0
+
+    def add(self, value: float) -> None:
+        # Reservoir sampling, so that the memory and the log size are bounded on the large sends.
+        self.count += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        elif (index := random.randrange(self.count)) < self.max_samples:  # nosec: B311
+            self.samples[index] = value
+
+
+@dataclasses.dataclass
+class TrackedCache:
+    stats: CacheStatsType
+    last_hits: int = 0
+    last_misses: int = 0
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str, sink: MetricSink, enabled: bool = True, max_samples: int = 500) -> None:
+        self.namespace = namespace
+        self.sink = sink
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters: dict[DimensionsType, dict[str, tuple[MetricUnitType, float]]] = {}
+        self._histograms: dict[DimensionsType, dict[str, Histogram]] = {}
+        self._caches: dict[str, TrackedCache] = {}
+
+    @staticmethod
+    def _get_dimensions(dimensions: dict[str, str]) -> DimensionsType:
+        return tuple(sorted((k, str(v)) for k, v in dimensions.items()))
+
+    def increment(self, name: str, value: float = 1, *, unit: MetricUnitType = "Count", **dimensions: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            counters = self._counters.setdefault(self._get_dimensions(dimensions), {})
+            counters[name] = (unit, counters.get(name, (unit, 0.0))[1] + value)
+
+    def observe(self, name: str, value: float, *, unit: MetricUnitType = "Milliseconds", **dimensions: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            histograms = self._histograms.setdefault(self._get_dimensions(dimensions), {})
+            if not (histogram := histograms.get(name)):
+                histogram = histograms[name] = Histogram(unit=unit, max_samples=self.max_samples)
+            histogram.add(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **dimensions: str) -> typing.Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started_at) * 1000, unit="Milliseconds", **dimensions)
+
+    def track_cache(self, name: str, stats: CacheStatsType) -> None:
+        """Reports the hits and misses of the cache since the last flush."""
+        with self._lock:
+            self._caches[name] = TrackedCache(stats=stats, last_hits=stats.hits, last_misses=stats.misses)
+
+    def _collect_caches(self) -> None:
+        for name, cache in self._caches.items():
+            hits, misses = cache.stats.hits - cache.last_hits, cache.stats.misses - cache.last_misses
+            cache.last_hits, cache.last_misses = cache.stats.hits, cache.stats.misses
+            if hits or misses:
+                self.increment("CacheHitCount", hits, Cache=name)
+                self.increment("CacheMissCount", misses, Cache=name)
+                self.increment("CacheHitRate", hits / (hits + misses) * 100, unit="Percent", Cache=name)
+
+    def _build_documents(
+        self,
+        dimensions: DimensionsType,
+        counters: dict[str, tuple[MetricUnitType, float]],
+        histograms: dict[str, Histogram],
+        timestamp_ms: int,
+    ) -> typing.Iterator[EMFDocumentType]:
+        # Samples more than the limit are split into the multiple documents, and the counters are on the first one.
+        chunk_count = max([1] + [-(-len(h.samples) // EMF_MAX_VALUES_PER_METRIC) for h in histograms.values()])
+        for chunk_index in range(chunk_count):
+            values: dict[str, tuple[MetricUnitType, float | list[float]]] = dict(counters) if chunk_index == 0 else {}
+            start, end = chunk_index * EMF_MAX_VALUES_PER_METRIC, (chunk_index + 1) * EMF_MAX_VALUES_PER_METRIC
+            for name, histogram in histograms.items():
+                if samples := histogram.samples[start:end]:
+                    values[name] = (histogram.unit, [round(s, 3) for s in samples])
+
+            if values:
+                yield {
+                    "_aws": {
+                        "Timestamp": timestamp_ms,
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": self.namespace,
+                                "Dimensions": [[k for k, _ in dimensions]],
+                                "Metrics": [{"Name": name, "Unit": unit} for name, (unit, _) in values.items()],
+                            }
+                        ],
+                    },
+                    **dict(dimensions),
+                    **{name: value for name, (_, value) in values.items()},
+                }
+
+    def flush(self) -> None:
+        if not self.enabled:
+            return
+
+        self._collect_caches()
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+
+        timestamp_ms = int(time.time() * 1000)
+        for dimensions in counters.keys() | histograms.keys():
+            for document in self._build_documents(
+                dimensions, counters.get(dimensions, {}), histograms.get(dimensions, {}), timestamp_ms
+            ):
+                self.sink.write(document)
+
+
+def get_sink(sink_type: config_module.MetricSinkType) -> MetricSink:
+    return MemoryMetricSink() if sink_type == "memory" else StdoutMetricSink()
+
+
+metrics = MetricsRegistry(
+    namespace=config_module.config.infra.metrics_namespace,
+    sink=get_sink(config_module.config.infra.metrics_sink),
+    enabled=config_module.config.infra.metrics_enabled,
+    max_samples=config_module.config.infra.metrics_max_samples,
+)
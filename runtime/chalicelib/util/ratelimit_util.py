@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses
+import fcntl
+import functools
+import hashlib
+import pathlib
+import threading
+import time
+import typing
+
+import chalicelib.config as config_module
+
+# Seconds to wait until the reserved token is available on the bucket.
+WaitSecondType = float
+
+# Uses the server time to avoid clock skew between containers.
+# The result is returned as string, as Redis converts Lua numbers to integers.
+REDIS_RESERVE_SCRIPT = """
+local rate, burst, count = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local server_time = redis.call('TIME')
+local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or burst)
+local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at') or now)
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate) - count
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 1)
+return tostring(math.max(-tokens / rate, 0))
+"""
+
+
+class RateLimitBackend(typing.Protocol):
+    def reserve(self, key: str, rate: float, burst: float, count: float = 1) -> WaitSecondType: ...
+
+
+@dataclasses.dataclass
+class TokenBucket:
+    rate: float
+    burst: float
+    tokens: float
+    updated_at: float
+
+    def get_tokens(self, now: float) -> float:
+        return min(self.burst, self.tokens + max(now - self.updated_at, 0.0) * self.rate)
+
+    def reserve(self, now: float, count: float = 1) -> WaitSecondType:
+        # Tokens can go below zero, which means that the token is reserved for the later caller.
+        self.tokens, self.updated_at = self.get_tokens(now=now) - count, now
+        return max(-self.tokens / self.rate, 0.0)
+
+
+class LocalRateLimitBackend:
+    max_bucket_count: typing.ClassVar[int] = 10_000
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def reserve(self, key: str, rate: float, burst: float, count: float = 1) -> WaitSecondType:
+        with self._lock:
+            now = time.monotonic()
+            if len(self._buckets) >= self.max_bucket_count:
+                # Fully refilled buckets are same as the new ones, so we can drop them.
+                self._buckets = {k: v for k, v in self._buckets.items() if v.get_tokens(now=now) < v.burst}
+
+            bucket = self._buckets.setdefault(key, TokenBucket(rate=rate, burst=burst, tokens=burst, updated_at=now))
+            return bucket.reserve(now=now, count=count)
+
+
+class FileRateLimitBackend:
+    """Shares buckets between processes on the same host by using file locks."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def reserve(self, key: str, rate: float, burst: float, count: float = 1) -> WaitSecondType:
+        bucket_path = self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.bucket"
+        with bucket_path.open(mode="a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                now = time.time()
+                bucket = TokenBucket(rate=rate, burst=burst, tokens=burst, updated_at=now)
+                with contextlib.suppress(ValueError):
+                    tokens, updated_at = f.read().split()
+                    bucket.tokens, bucket.updated_at = float(tokens), float(updated_at)
+
+                wait_second = bucket.reserve(now=now, count=count)
+                f.seek(0)
+                f.truncate()
+                f.write(f"{bucket.tokens} {bucket.updated_at}")
+                # Must be written before unlocking, or the next holder of the lock reads the stale bucket.
+                f.flush()
+                return wait_second
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RedisRateLimitBackend:
+    """Shares buckets between Lambda containers by using Redis or any Redis-compatible server."""
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "`redis` package is required to use the redis rate limit backend, install it with the `redis` extra."
+            ) from e
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(REDIS_RESERVE_SCRIPT)
+
+    def reserve(self, key: str, rate: float, burst: float, count: float = 1) -> WaitSecondType:
+        return float(self.script(keys=[f"notico:ratelimit:{key}"], args=[rate, burst, count]))
+
+
+@functools.cache
+def get_backend(backend_type: config_module.RateLimitBackendType, url: str | None = None) -> RateLimitBackend:
+    if backend_type == "file":
+        return FileRateLimitBackend(directory=url or "/tmp/notico-ratelimit")  # nosec: B108
+    if backend_type == "redis":
+        if not url:
+            raise ValueError("URL of the redis server must be given to use the redis rate limit backend.")
+        return RedisRateLimitBackend(url=url)
+    return LocalRateLimitBackend()
+
+
+@dataclasses.dataclass
+class RateLimiter:
+    name: str
+    backend: RateLimitBackend
+    # Limits for all requests of the service.
+    rate: float | None = None
+    burst: float | None = None
+    # Limits for requests to the same receiver, like Telegram's per-chat limit.
+    per_key_rate: float | None = None
+    per_key_burst: float | None = None
+
+    @classmethod
+    def from_config(cls, name: str, config: config_module.ServiceConfig) -> RateLimiter:
+        return cls(
+            name=name,
+            backend=get_backend(config.rate_limit_backend, config.rate_limit_backend_url),
+            rate=config.rate_limit_per_second,
+            burst=config.rate_limit_burst,
+            per_key_rate=config.rate_limit_per_receiver_per_second,
+            per_key_burst=config.rate_limit_per_receiver_burst,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate or self.per_key_rate)
+
+    def reserve_for_key(self, key: str | None) -> WaitSecondType:
+        if key is None or not self.per_key_rate:
+            return 0.0
+        return self.backend.reserve(f"{self.name}:{key}", self.per_key_rate, self.per_key_burst or 1)
+
+    def reserve_global(self, count: float = 1) -> WaitSecondType:
+        if not self.rate:
+            return 0.0
+        return self.backend.reserve(self.name, self.rate, self.burst or self.rate, count)
+
+    # The per-receiver bucket is waited first, so that the global token is not reserved while
+    # waiting for the receiver's turn, as it would slow down the requests for the other receivers.
+    # `count` is the number of tokens to be reserved on the global bucket, e.g. the number of receivers of a request.
+    def wait(self, key: str | None = None, count: float = 1) -> None:
+        if (wait_second := self.reserve_for_key(key)) > 0:
+            time.sleep(wait_second)
+        if (wait_second := self.reserve_global(count)) > 0:
+            time.sleep(wait_second)
+
+    async def _reserve_async(self, reserve: typing.Callable[[], WaitSecondType]) -> WaitSecondType:
+        # File and redis backends do the blocking I/O, which must not block the other coroutines on the event loop.
+        if isinstance(self.backend, LocalRateLimitBackend):
+            return reserve()
+        return await asyncio.to_thread(reserve)
+
+    async def wait_async(self, key: str | None = None, count: float = 1) -> None:
+        if (wait_second := await self._reserve_async(functools.partial(self.reserve_for_key, key))) > 0:
+            await asyncio.sleep(wait_second)
+        if (wait_second := await self._reserve_async(functools.partial(self.reserve_global, count))) > 0:
+            await asyncio.sleep(wait_second)
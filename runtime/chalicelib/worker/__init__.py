@@ -1,41 +1,108 @@
-import json
 import logging
 import pathlib
+import time
 import typing
 
 import chalice.app
 import chalicelib.config as config_module
+import chalicelib.util.concurrency_util as concurrency_util
 import chalicelib.util.import_util as import_util
+import chalicelib.util.metric_util as metric_util
+import pydantic
 
 WorkerType = typing.Callable[[chalice.app.SQSRecord], dict[str, typing.Any]]
 
 logger = logging.getLogger(__name__)
-workers: dict[str, WorkerType] = {}
 worker_handler_blueprint = chalice.app.Blueprint(__name__)
+workers: import_util.LazyRegistry[WorkerType] = import_util.LazyRegistry(
+    pattern="workers", dir=pathlib.Path(__file__).parent, get_name=lambda worker: worker.__name__
+)
 
-for _workers in typing.cast(
-    list[list[WorkerType]],
-    import_util.auto_import_patterns(pattern="workers", file_prefix="", dir=pathlib.Path(__file__).parent),
-):
-    _func_names = {worker.__name__ for worker in _workers}
-    if _duplicated := _func_names & workers.keys():
-        raise ValueError(f"Worker {_duplicated} is already registered")
 
-    workers.update({worker.__name__: worker for worker in _workers})
+class SQSRecordHeader(pydantic.BaseModel):
+    # Only the worker name is decoded here, the payload is skipped without being built as Python objects.
+    worker: str
 
 
-@worker_handler_blueprint.on_sqs_message(queue=config_module.config.infra.queue_name)
-def sqs_handler(event: chalice.app.SQSEvent) -> list[dict[str, typing.Any]]:
+def get_remaining_second(event: chalice.app.SQSEvent) -> float:
+    # Message must be handled before it becomes visible again on the queue, or it'll be handled twice.
+    infra_config = config_module.config.infra
+    remaining_second = float(infra_config.queue_visibility_timeout_second)
+    if get_remaining_time_in_millis := getattr(event.context, "get_remaining_time_in_millis", None):
+        remaining_second = min(remaining_second, get_remaining_time_in_millis() / 1000)
+    return remaining_second - infra_config.dispatch_deadline_margin_second
+
+
+def get_message_id(record: chalice.app.SQSRecord) -> str:
+    return record.to_dict()["messageId"]
+
+
+def get_message_group_id(record: chalice.app.SQSRecord) -> str | None:
+    return record.to_dict().get("attributes", {}).get("MessageGroupId", None)
+
+
+def record_queue_age(record: chalice.app.SQSRecord) -> None:
+    # SentTimestamp is the epoch milliseconds when the message was sent to the queue.
+    if sent_timestamp := record.to_dict().get("attributes", {}).get("SentTimestamp"):
+        metric_util.metrics.observe(
+            "QueueAge", time.time() * 1000 - int(sent_timestamp), Queue=config_module.config.infra.queue_name
+        )
+
+
+def handle_message_group(records: list[chalice.app.SQSRecord]) -> tuple[list[dict[str, typing.Any]], list[str]]:
     results: list[dict[str, typing.Any]] = []
-    for record in event:
+    failed_message_ids: list[str] = []
+
+    for record in records:
+        # Messages in the same FIFO message group must be handled in order,
+        # so the messages after the failed one must be retried too.
+        if failed_message_ids:
+            failed_message_ids.append(get_message_id(record))
+            continue
+
         try:
-            results.append(workers[json.loads(record.body)["worker"]](record))
+            results.append(workers[SQSRecordHeader.model_validate_json(record.body).worker](record))
         except Exception as e:
             logger.error(f"Failed to handle event: {record}", exc_info=e)
-            results.append({"error": "Failed to handle event"})
+            failed_message_ids.append(get_message_id(record))
+
+    return results, failed_message_ids
+
 
+@worker_handler_blueprint.on_sqs_message(
+    queue=config_module.config.infra.queue_name,
+    batch_size=config_module.config.infra.queue_batch_size,
+)
+def sqs_handler(event: chalice.app.SQSEvent) -> dict[str, list[dict[str, str]]]:
+    # Messages in different message groups don't need to be ordered, so each group is handled concurrently.
+    # Messages without a group (from standard queues) are independent from each other.
+    message_groups: dict[str, list[chalice.app.SQSRecord]] = {}
+    for record in event:
+        record_queue_age(record)
+        message_groups.setdefault(get_message_group_id(record) or get_message_id(record), []).append(record)
+
+    with concurrency_util.deadline_scope(remaining_second=get_remaining_second(event)):
+        group_results = concurrency_util.map_threaded(
+            func=handle_message_group,
+            items=message_groups.values(),
+            max_concurrency=config_module.config.infra.worker_max_group_concurrency,
+        )
+
+    results = [result for group_result, _ in group_results for result in group_result]
+    failed_message_ids = {message_id for _, group_failed_ids in group_results for message_id in group_failed_ids}
     logger.info(f"{results=}")
-    return results
+    metric_util.metrics.increment(
+        "FailedMessageCount", len(failed_message_ids), Queue=config_module.config.infra.queue_name
+    )
+
+    # Only failed messages are returned to the queue. See "ReportBatchItemFailures" on the AWS Lambda document.
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id}
+            for record in event
+            if (message_id := get_message_id(record)) in failed_message_ids
+        ]
+    }
 
 
 def register_worker(app: chalice.app.Chalice) -> None:
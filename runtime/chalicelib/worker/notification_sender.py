@@ -1,47 +1,229 @@
 import functools
+import hashlib
+import json
+import logging
+import time
 import typing
+import uuid
 
 import chalice.app
+import chalicelib.aws_resource as aws_resource
+import chalicelib.config as config_module
 import chalicelib.send_manager as send_manager
 import chalicelib.send_manager.__interface__ as send_mgr_interface
+import chalicelib.util.concurrency_util as concurrency_util
+import chalicelib.util.decorator_util as decorator_util
+import chalicelib.util.metric_util as metric_util
 import pydantic
 
+logger = logging.getLogger(__name__)
+
+# SQS allows up to 10 messages per batch request.
+SQS_MAX_BATCH_SIZE = 10
+SQSBatchEntryType = dict[str, str]
+
+
+class EnqueueFailedException(Exception):
+    pass
+
 
 class WorkerPayload(pydantic.BaseModel):
     sender_type: str
-    sender_payload: dict[str, typing.Any]
+    sender_payload: send_mgr_interface.SendRequest
 
-    @functools.cached_property
+    @property
     def send_manager(self) -> send_mgr_interface.SendManagerInterface:
         return send_manager.send_managers[self.sender_type]
 
-    @functools.cached_property
-    def send_request_payload(self) -> send_mgr_interface.SendRequest:
-        return self.send_manager.send_request_cls.model_validate(self.sender_payload)
-
-    @pydantic.field_validator("sender_type", mode="before")
-    @classmethod
-    def validate_sender_type(cls, value: str) -> str:
-        if value not in send_manager.send_managers:
-            raise ValueError(f"Invalid sender type: {value}")
-        return value
-
-    @pydantic.model_validator(mode="after")
-    def validate_sender_payload(self) -> typing.Self:
-        self.send_request_payload
-        return self
-
     def send(self) -> dict[str, str]:
-        return self.send_manager.send(self.send_request_payload)
+        return self.send_manager.send(self.sender_payload)
+
+    async def send_async(self) -> dict[str, str]:
+        return await self.send_manager.send_async(self.sender_payload)
 
 
 class SQSRecordBody(pydantic.BaseModel):
     worker: str
     worker_payload: WorkerPayload
+    # Given when the message is enqueued by the async mode of the send API.
+    tracking_id: str | None = None
+
+
+class WorkerPayloadHeader(pydantic.BaseModel):
+    sender_type: str
+
+
+class SQSRecordBodyHeader(pydantic.BaseModel):
+    # Only the sender type is decoded here, the payload is skipped without being built as Python objects.
+    worker_payload: WorkerPayloadHeader
+
+
+class EnqueueResult(pydantic.BaseModel):
+    tracking_id: str
+    message_count: int
+    recipient_count: int
+
+
+@functools.cache
+def get_sqs_record_body_adapter(sender_type: str) -> pydantic.TypeAdapter[SQSRecordBody]:
+    """
+    Builds the model of which `sender_payload` is the `send_request_cls` of the sender,
+    so that the payload is parsed into it directly, and only the send manager of the sender is imported.
+    """
+    payload_model = pydantic.create_model(
+        f"{sender_type}_WorkerPayload",
+        __base__=WorkerPayload,
+        sender_payload=(send_manager.send_managers[sender_type].send_request_cls, ...),
+    )
+    body_model = pydantic.create_model(
+        f"{sender_type}_SQSRecordBody", __base__=SQSRecordBody, worker_payload=(payload_model, ...)
+    )
+    return pydantic.TypeAdapter(body_model)
+
+
+def get_content_hash(*contents: str) -> str:
+    content_hash = hashlib.sha256()
+    for content in contents:
+        content_hash.update(content.encode(encoding="utf-8"))
+    return content_hash.hexdigest()
+
+
+@functools.cache
+def get_queue_url() -> str:
+    return aws_resource.get_client("sqs").get_queue_url(QueueName=config_module.config.infra.queue_name)["QueueUrl"]
+
+
+def build_message_bodies(
+    service_name: str, request: send_mgr_interface.SendRequest
+) -> tuple[str, list[tuple[str, int]]]:
+    """
+    Splits the recipients of the request into the SQS record bodies within the size limit,
+    and returns the tracking ID and the (body, recipient count) pairs.
+    """
+    infra_config = config_module.config.infra
+    payload = request.model_dump(mode="json")
+    # Recipients are serialized once, and joined into the bodies, instead of dumping the payload for every chunk.
+    recipients = [f"{json.dumps(k)}: {json.dumps(v)}" for k, v in payload.pop("personalized_context").items()]
+    shared_payload = json.dumps(payload)
+    # Same request gets the same tracking ID, so that the retried request is deduplicated by the queue.
+    tracking_id = get_content_hash(service_name, shared_payload, *recipients)[:32]
+
+    # Body is split around the unique placeholder of the recipients, which can't collide with the user content.
+    placeholder = uuid.uuid4().hex
+    prefix, _, suffix = json.dumps(
+        {
+            "worker": notification_sender.__name__,
+            "worker_payload": {
+                "sender_type": service_name,
+                "sender_payload": {**payload, "personalized_context": placeholder},
+            },
+            "tracking_id": tracking_id,
+        }
+    ).partition(json.dumps(placeholder))
+    prefix, suffix = f"{prefix}{{", f"}}{suffix}"
+
+    bodies: list[tuple[str, int]] = []
+    chunk: list[str] = []
+    chunk_byte = base_byte = len(prefix) + len(suffix)
+    for recipient in recipients:
+        # Bodies are ASCII, as json.dumps escapes the non-ASCII characters, so the length is the size in bytes.
+        recipient_byte = len(recipient) + len(", ")
+        if base_byte + recipient_byte > infra_config.enqueue_max_message_byte:
+            raise ValueError(f"Recipient is too large to be enqueued: {recipient[:100]}")
+        if chunk and (
+            chunk_byte + recipient_byte > infra_config.enqueue_max_message_byte
+            or len(chunk) >= infra_config.enqueue_max_recipients_per_message
+        ):
+            bodies.append((prefix + ", ".join(chunk) + suffix, len(chunk)))
+            chunk, chunk_byte = [], base_byte
+        chunk.append(recipient)
+        chunk_byte += recipient_byte
+    if chunk:
+        bodies.append((prefix + ", ".join(chunk) + suffix, len(chunk)))
+    return tracking_id, bodies
+
+
+def get_message_group_id(service_name: str, tracking_id: str, index: int) -> str:
+    match config_module.config.infra.enqueue_message_group_by:
+        case "service":
+            return service_name
+        case "request":
+            return tracking_id
+        case _:
+            return f"{tracking_id}-{index}"
+
+
+def build_batches(entries: list[SQSBatchEntryType]) -> list[list[SQSBatchEntryType]]:
+    # Total size of a batch request is limited too, not only the number of the messages.
+    max_byte = config_module.config.infra.enqueue_max_message_byte
+    batches: list[list[SQSBatchEntryType]] = []
+    batch_byte = 0
+    for entry in entries:
+        if not batches or len(batches[-1]) >= SQS_MAX_BATCH_SIZE or batch_byte + len(entry["MessageBody"]) > max_byte:
+            batches.append([])
+            batch_byte = 0
+        batches[-1].append(entry)
+        batch_byte += len(entry["MessageBody"])
+    return batches
+
+
+def send_batch(entries: list[SQSBatchEntryType]) -> list[dict[str, typing.Any]]:
+    """Sends the messages, and returns the failed entries. Entries failed by the server are retried."""
+    policy = decorator_util.RetryPolicy(retry_count=config_module.config.infra.aws_max_attempts)
+    entries_by_id = {entry["Id"]: entry for entry in entries}
+    failed: list[dict[str, typing.Any]] = []
+    for attempt in range(policy.retry_count):
+        response = aws_resource.get_client("sqs").send_message_batch(QueueUrl=get_queue_url(), Entries=entries)
+        if not (failed := response.get("Failed", [])) or any(f.get("SenderFault") for f in failed):
+            break
+        if attempt + 1 < policy.retry_count:
+            entries = [entries_by_id[f["Id"]] for f in failed]
+            time.sleep(policy.get_delay(attempt=attempt))
+    return failed
+
+
+def enqueue(service_name: str, request: send_mgr_interface.SendRequest) -> EnqueueResult:
+    """
+    Enqueues the request to the queue as the messages of `notification_sender`, so that it's sent by the worker.
+    Deduplication IDs are the hash of the message contents, so the request can be retried safely on failure,
+    as the messages already enqueued are deduplicated by the FIFO queue within the deduplication interval.
+    """
+    tracking_id, bodies = build_message_bodies(service_name=service_name, request=request)
+    entries: list[SQSBatchEntryType] = [
+        {
+            # Id only needs to be unique in a batch request, but the index is unique in the whole request.
+            "Id": str(index),
+            "MessageBody": body,
+            "MessageGroupId": get_message_group_id(service_name=service_name, tracking_id=tracking_id, index=index),
+            "MessageDeduplicationId": get_content_hash(body),
+        }
+        for index, (body, _) in enumerate(bodies)
+    ]
+
+    failed = [
+        f
+        for batch_failed in concurrency_util.map_threaded(
+            func=send_batch,
+            items=build_batches(entries),
+            max_concurrency=config_module.config.infra.enqueue_max_concurrency,
+        )
+        for f in batch_failed
+    ]
+    if failed:
+        raise EnqueueFailedException(f"Failed to enqueue {len(failed)} of {len(entries)} messages: {failed}")
+
+    recipient_count = sum(count for _, count in bodies)
+    metric_util.metrics.increment("EnqueuedRecipientCount", recipient_count, Service=service_name)
+    return EnqueueResult(tracking_id=tracking_id, message_count=len(entries), recipient_count=recipient_count)
 
 
 def notification_sender(record: chalice.app.SQSRecord) -> dict[str, str]:
-    return SQSRecordBody.model_validate_json(record.body).worker_payload.send()
+    sender_type = SQSRecordBodyHeader.model_validate_json(record.body).worker_payload.sender_type
+    body = get_sqs_record_body_adapter(sender_type).validate_json(record.body)
+    if body.tracking_id:
+        logger.info(f"Sending the enqueued request: {body.tracking_id=}")
+    # Messages of all groups are sent on the shared event loop, so the async clients keep their connections.
+    return concurrency_util.run_coroutine(body.worker_payload.send_async())
 
 
 workers = [notification_sender]